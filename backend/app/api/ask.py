@@ -1,13 +1,26 @@
-from typing import List
-from fastapi import APIRouter
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ..services.embeddings import embed_texts
-from ..services.vector_db import VectorDB
-from ..services.llm_client import generate_answer
+from ..services.embeddings import EmbeddingError, embed_texts
+from ..services.vector_db import VectorDB, get_vector_db
+from ..services.llm_client import MOCK_ANSWER, generate_answer, stream_answer
+from ..services.answer_cache import get_answer_cache
+from ..services.doc_registry import get_doc_registry
+from ..services.lexical_index import get_lexical_index, reciprocal_rank_fusion, sync_docs
+from ..services.prompt_builder import BuiltPrompt, build_prompt
+from ..services.metrics import observe_stage, stage_timer
 import asyncio
 
 TOP_K_USER = 5
 TOP_M_CATEGORY = 3
+# "hybrid" fuses BM25 and vector rankings of the user's chunks; "vector" is cosine only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
 
 router = APIRouter(prefix="", tags=["ask"])
 
@@ -16,31 +29,117 @@ class AskRequest(BaseModel):
     doc_ids: List[str]
     question: str
     category: str
+    retrieval: Optional[str] = None  # "hybrid" | "vector"; defaults to RETRIEVAL_MODE
 
 @router.post("/ask")
-async def ask(payload: AskRequest):
-    vdb = VectorDB()
-    qvec = embed_texts([payload.question])[0]
+async def ask(payload: AskRequest, vdb: VectorDB = Depends(get_vector_db)):
+    with stage_timer("retrieve"):
+        qvec, top_user, top_cat = await _retrieve(payload, vdb)
+    context_ids, versions = await _context(payload, top_user, top_cat)
 
-    # --- Retrieve user document chunks ---
+    cache = get_answer_cache()
+    answer = cache.lookup(qvec, context_ids, versions)
+    cached = answer is not None
+    prompt_tokens = 0
+    if not cached:
+        prompt = _build_prompt(payload, top_user, top_cat)
+        prompt_tokens = prompt.prompt_tokens
+        # --- Async-safe LLM call ---
+        with stage_timer("llm"):
+            answer = await asyncio.to_thread(generate_answer, prompt.text)
+        if answer and answer != MOCK_ANSWER:
+            cache.store(qvec, context_ids, versions, answer)
+
+    return {
+        "answer": answer,
+        "cached": cached,
+        "prompt_tokens": prompt_tokens,
+        **_assessment(top_user, top_cat),
+    }
+
+
+@router.post("/ask/stream")
+async def ask_stream(payload: AskRequest, request: Request, vdb: VectorDB = Depends(get_vector_db)):
+    """
+    Server-sent events: one `sources` event as soon as retrieval is done, then
+    `token` events as Gemini generates, then `done` (or `error`).
+    """
+    with stage_timer("retrieve"):
+        qvec, top_user, top_cat = await _retrieve(payload, vdb)
+    context_ids, versions = await _context(payload, top_user, top_cat)
+    cache = get_answer_cache()
+    cached_answer = cache.lookup(qvec, context_ids, versions)
+
+    async def events():
+        yield _sse("sources", {"sources": [_source_item(m) for m in top_user + top_cat]})
+        if cached_answer is not None:
+            yield _sse("token", {"text": cached_answer})
+            yield _sse("done", {"cached": True, "prompt_tokens": 0, **_assessment(top_user, top_cat)})
+            return
+        prompt = _build_prompt(payload, top_user, top_cat)
+        started = time.perf_counter()
+        tokens = stream_answer(prompt.text)
+        parts = []
+        try:
+            async for text in tokens:
+                # Stop generating (and spending quota) once the client has gone away
+                if await request.is_disconnected():
+                    return
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        finally:
+            await tokens.aclose()
+        observe_stage("llm", time.perf_counter() - started)
+        answer = "".join(parts)
+        if answer and answer != MOCK_ANSWER:
+            cache.store(qvec, context_ids, versions, answer)
+        yield _sse("done", {"cached": False, "prompt_tokens": prompt.prompt_tokens, **_assessment(top_user, top_cat)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _retrieve(payload: AskRequest, vdb: VectorDB) -> Tuple[List[float], List[Dict], List[Dict]]:
+    try:
+        qvec = (await asyncio.to_thread(embed_texts, [payload.question]))[0]
+    except EmbeddingError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # --- Retrieve user document chunks (best TOP_K_USER across all docs) ---
     sources = []
-    for doc_id in payload.doc_ids:
-        matches = vdb.query(vector=qvec, top_k=TOP_K_USER, filter={"doc_id": doc_id})
-        for m in matches:
-            md = m.get("metadata", {})
-            md["similarity"] = m.get("score", 0)
-            md["source"] = "user"
-            # Ensure text is present
-            if "text" in md and md["text"].strip():
-                sources.append(md)
+    filters = [{"doc_id": doc_id} for doc_id in payload.doc_ids]
+    mode = payload.retrieval or RETRIEVAL_MODE
+    if mode == "hybrid":
+        matches = await _hybrid_matches(payload.question, qvec, filters, vdb)
+    else:
+        matches = await asyncio.to_thread(vdb.query_many, qvec, filters, TOP_K_USER)
+    for m in matches:
+        md = m.get("metadata", {})
+        md["similarity"] = m.get("score") or 0
+        md["source"] = "user"
+        if "rrf" in m:
+            md["rrf"] = m["rrf"]
+            md["bm25"] = m["bm25"]
+        # Ensure text is present
+        if "text" in md and md["text"].strip():
+            sources.append(md)
 
     # Always include top user chunks (no similarity filtering)
     top_user = sources[:TOP_K_USER]
 
     # --- Retrieve category context only if user chunks < 3 ---
+    # Seeded corpus only (scripts/seed_category_db.py), never other users' uploads
     category_add = []
     if len(top_user) < 3:
-        cat_matches = vdb.query(vector=qvec, top_k=TOP_M_CATEGORY, filter={"category": payload.category})
+        cat_matches = await asyncio.to_thread(
+            vdb.query, vector=qvec, top_k=TOP_M_CATEGORY, filter={"category": payload.category, "source": "category"}
+        )
         for m in cat_matches:
             md = m.get("metadata", {})
             md["similarity"] = m.get("score", 0)
@@ -48,42 +147,74 @@ async def ask(payload: AskRequest):
             if "text" in md and md["text"].strip():
                 category_add.append(md)
     top_cat = category_add[:2]
+    return qvec, top_user, top_cat
 
-    # --- Formatting functions ---
-    def fmt_user(m):
-        return f"1) [DOC:{m['doc_id']} | CHUNK:{m['chunk_id']} | PAGES:{m.get('page_start','-')}-{m.get('page_end','-')} | SIM:{m.get('similarity',0):.2f}]\n{m['text']}"
-
-    def fmt_cat(m):
-        return f"1) [CATEGORY:{payload.category} | SRC:{m.get('doc_id','cat')} | CHUNK:{m.get('chunk_id','-')}]\n{m['text']}"
-
-    # --- Build prompt ---
-    prompt = (
-        "SYSTEM: You are LegalLens, an assistant that analyzes legal agreements. "
-        "Summarize what the uploaded contract says about repayment, interest, penalties, and obligations. "
-        "Highlight risks and burdens for the borrower in simple language. "
-        "If the document lacks details, say that clearly. "
-        "You may state whether the terms seem strict, flexible, risky, or favorable, but DO NOT directly tell the user "
-        "to take or not take the loan. "
-        "Use subheadings for each section in **bold** format (for example: **Repayment:**, **Interest:**, **Penalties:**, **Obligations:**, **Action steps:**). "
-        f"USER QUESTION:\n{payload.question}\n\n"
-        "USER DOCUMENT CHUNKS (highest relevance first):\n" +
-        ("\n\n".join([fmt_user(m) for m in top_user]) if top_user else "(none)") +
-        "\n\nCATEGORY CONTEXT (optional, supporting only if user chunks insufficient):\n" +
-        ("\n\n".join([fmt_cat(m) for m in top_cat]) if top_cat else "(none)") +
-        "\n\nTASK:\n1) Answer the user's question concisely in plain English.\n"
-        "2) If the user document lacks direct info, use category context and explicitly say 'Using category precedents:'.\n"
-        "3) Provide a short 'Action steps:' section (2-4 bullet points) with the heading in **bold**.\n"
-        "4) Output must be plain text only — no markdown formatting except for the bold subheadings.\n\nEND."
+
+async def _hybrid_matches(question: str, qvec: List[float], filters: List[Dict], vdb: VectorDB) -> List[Dict]:
+    """
+    Reciprocal rank fusion of the vector and BM25 rankings, so chunks that use
+    the question's exact terms ("prepayment", "indemnify") surface even when
+    their embeddings rank them lower. "score" stays the cosine similarity
+    (0 for lexical-only hits) so confidence keeps its meaning.
+    """
+    if not filters:
+        return []
+    def lexical_search() -> List[Dict]:
+        # Documents ingested before a restart or by another worker are loaded on first use
+        sync_docs([f["doc_id"] for f in filters if "doc_id" in f], vdb)
+        return get_lexical_index().search(question, HYBRID_CANDIDATES, filters)
+
+    vector_hits, lexical_hits = await asyncio.gather(
+        asyncio.to_thread(vdb.query_many, qvec, filters, HYBRID_CANDIDATES),
+        asyncio.to_thread(lexical_search),
     )
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits], TOP_K_USER)
+    return [
+        {
+            "id": m["id"],
+            "score": m["scores"].get(0) or 0,
+            "rrf": m["rrf"],
+            "bm25": m["scores"].get(1) or 0,
+            "metadata": m["metadata"],
+        }
+        for m in fused
+    ]
+
+
+async def _context(payload: AskRequest, top_user: List[Dict],
+                   top_cat: List[Dict]) -> Tuple[List[str], Dict[str, Optional[float]]]:
+    """Answer-cache key parts: retrieved chunk ids, and the version of every doc the answer depends on."""
+    context_ids = [f"category:{payload.category}"] + [
+        m.get("id") or f"{m.get('doc_id')}_chunk_{m.get('chunk_id')}" for m in top_user + top_cat
+    ]
+    doc_ids = set(payload.doc_ids) | {m["doc_id"] for m in top_user + top_cat if m.get("doc_id")}
+    return context_ids, await asyncio.to_thread(get_doc_registry().versions, doc_ids)
 
-    # --- Async-safe LLM call ---
-    answer = await asyncio.to_thread(generate_answer, prompt)
 
+def _build_prompt(payload: AskRequest, top_user: List[Dict], top_cat: List[Dict]) -> BuiltPrompt:
+    with stage_timer("prompt_build"):
+        return build_prompt(payload.question, payload.category, top_user, top_cat)
+
+
+def _assessment(top_user: List[Dict], top_cat: List[Dict]) -> Dict:
     # --- Risk scoring placeholder ---
     risk = {"level": "Low", "score": 0.2}
-
     return {
-        "answer": answer,
         "risk": risk,
         "confidence": max([m.get("similarity", 0) for m in top_user + top_cat], default=0),
     }
+
+
+def _source_item(m: Dict) -> Dict:
+    return {
+        "doc_id": m.get("doc_id"),
+        "chunk_id": m.get("chunk_id"),
+        "page_range": f"{m.get('page_start', '-')}-{m.get('page_end', '-')}",
+        "similarity": m.get("similarity", 0),
+        "source": m.get("source"),
+        "text_snippet": m.get("text", "")[:300],
+    }
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,22 +1,16 @@
-import uuid
+import asyncio
 from typing import List
 
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 
-from ..services.pdf_extractor import extract_text_by_page
-from ..services.chunker import chunk_pages
-from ..services.embeddings import embed_texts
-from ..services.vector_db import VectorDB
-from ..services.storage import upload_pdf
+from ..services.doc_registry import get_doc_registry
+from ..services.hashing import doc_id_for
+from ..services.ingest import IngestFile, IngestJob, QueueFull, get_ingest_queue
+from ..services.upload_spool import UploadTooLarge, spool_upload
+from ..services.vector_db import VectorDB, get_vector_db
 import logging
 
-from google import genai
-from google.genai import types
-
-# Initialize Gemini client
-client = genai.Client()
-
 router = APIRouter(prefix="", tags=["upload"])
 logger = logging.getLogger(__name__)
 
@@ -26,92 +20,83 @@ async def upload(
     files: List[UploadFile] = File(...),
     category: str = Form(...),
     user_id: str = Form(...),
+    vdb: VectorDB = Depends(get_vector_db),
 ):
+    ingest_files = []
     try:
         if not files:
             return JSONResponse({"error": "no files"}, status_code=400)
 
-        doc_id = str(uuid.uuid4())
-        all_chunks = []
-
-        # Read first file
-        primary_file = files[0]
-        pdf_bytes = await primary_file.read()
-
-        # Upload original PDF to Supabase
-        try:
-            path = upload_pdf(
-                user_id=user_id,
-                doc_id=doc_id,
-                filename=primary_file.filename or f"{doc_id}.pdf",
-                data=pdf_bytes,
-            )
-        except Exception as se:
-            logger.exception("Supabase upload failed")
-            return JSONResponse({"error": f"storage upload failed: {se}"}, status_code=400)
-
-        # Extract, chunk & embed
-        print("Extracting text from PDF...")
-        pages = extract_text_by_page(pdf_bytes)
-        print(f"Extracted {len(pages)} pages")
-
-        print("Chunking pages...")
-        chunks = chunk_pages(pages)
-        print(f"Created {len(chunks)} chunks")
-        all_chunks.extend(chunks)
-        
-        print("Generating embeddings...")
-
-
-        texts = [c["text"] for c in all_chunks]
-
-        result = client.models.embed_content(
-            model="gemini-embedding-001",
-            contents=texts,
-            config=types.EmbedContentConfig(output_dimensionality=768)  # set vector size
-        )
-
-        embeddings = [e.values for e in result.embeddings]
-
-        print("Embedding length example:", len(embeddings[0]))
-        print(f"Generated {len(embeddings)} embeddings")
-
-        # Prepare vectors for VectorDB
-        vdb = VectorDB()
-        vectors = []
-        for c, vec in zip(all_chunks, embeddings):
-            vectors.append({
-                "id": f"{doc_id}_chunk_{c['chunk_id']}",
-                "values": vec,
-                "metadata": {
-                    "id": f"{doc_id}_chunk_{c['chunk_id']}",
+        # Every file becomes its own document; duplicate files in one request collapse
+        seen = set()
+        existing = []
+        registry = get_doc_registry()
+        for f in files:
+            # Copied to a temp file and hashed in chunks; the ingest job reads it by path
+            spooled = await asyncio.to_thread(spool_upload, f.file, f.size)
+            # Same user + same bytes -> same doc_id, so a re-upload overwrites its vectors
+            if spooled.digest in seen:
+                spooled.remove()
+                continue
+            seen.add(spooled.digest)
+            doc_id = doc_id_for(user_id, spooled.digest)
+            # Already ingested from the same bytes under the same category: nothing to redo,
+            # unless the vector store has since lost the document (e.g. an in-memory store restarted)
+            doc = await asyncio.to_thread(registry.get, doc_id)
+            if doc and doc["content_hash"] == spooled.digest and doc["category"] == category \
+                    and doc["chunks_count"] is not None and await asyncio.to_thread(vdb.has_doc, doc_id):
+                spooled.remove()
+                existing.append({
                     "doc_id": doc_id,
-                    "user_id": user_id,
-                    "category": category,
-                    "page_start": c["page_start"],
-                    "page_end": c["page_end"],
-                    "chunk_id": c["chunk_id"],
-                    "text": c["text"],
-                    "source": "user",
-                },
-            })
-        print(len(vectors[0]))
+                    "filename": f.filename or doc["filename"],
+                    "content_hash": doc["content_hash"],
+                    "pages": doc["pages"],
+                    "chunks_count": doc["chunks_count"],
+                    "reused": True,
+                })
+                continue
+            ingest_files.append(IngestFile(
+                doc_id=doc_id,
+                filename=f.filename or f"{doc_id}.pdf",
+                digest=spooled.digest,
+                spooled=spooled,
+            ))
 
-        # Upsert into VectorDB
-        if vectors:
-            print(f"Upserting {len(vectors)} vectors to VectorDB...")
-            vdb.upsert(vectors)
-            print("Upsert complete.")
+        # Storage, extraction, embedding and upsert run on the ingest workers
+        job = IngestJob(user_id=user_id, category=category, files=ingest_files, existing=existing)
+        await get_ingest_queue().submit(job, vdb)
 
+        doc_ids = job.to_dict()["doc_ids"]
         return JSONResponse({
-            "status": "processed",
-            "doc_id": doc_id,
-            "chunks_count": len(all_chunks)
-        })
-
+            "status": job.status,
+            "job_id": job.id,
+            "doc_id": doc_ids[0],
+            "doc_ids": doc_ids,
+        }, status_code=200 if job.status == "done" else 202)
+
+    except UploadTooLarge as e:
+        _release(ingest_files)
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except QueueFull as e:
+        _release(ingest_files)
+        return JSONResponse({"error": str(e)}, status_code=503)
     except Exception as e:
+        _release(ingest_files)
         logger.exception("Upload failed")
         return JSONResponse(
-            {"error": str(e), "doc_id": doc_id if "doc_id" in locals() else None},
+            {"error": str(e)},
             status_code=500,
         )
+
+
+def _release(ingest_files: List[IngestFile]) -> None:
+    for f in ingest_files:
+        f.release()
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job {job_id}")
+    return job.to_dict()
@@ -1,15 +1,87 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from .api.upload import router as upload_router
-from .api.ask import router as ask_router
-from .api.export import router as export_router
+from fastapi import Depends, FastAPI
+from fastapi.middleware.cors import CORSMiddleware
 from fastapi import HTTPException
-from .services.vector_db import VectorDB
-from .services.storage import delete_pdf
+from fastapi.responses import JSONResponse, Response
+
+from .services.providers import STARTUP_WARM, gemini, startup_report, supabase
+
+# Each group is timed into the startup report (see /health "startup")
+with startup_report.phase("import:app.services"):
+    from .services.vector_db import VectorDB, get_vector_db
+    from .services.storage import get_storage
+    from .services.embeddings import embedding_cache_stats, embedding_engine_stats
+    from .services.ingest import get_ingest_queue
+    from .services.answer_cache import get_answer_cache
+    from .services.lexical_index import get_lexical_index, rebuild_from_registry
+    from .services.doc_registry import DOCS_PAGE_SIZE, chunk_ids, get_doc_registry
+    from .services.pdf_extractor import shutdown_extract_pool, warm_extract_pool
+    from .services.report_renderer import get_report_renderer
+    from .services.metrics import http_metrics_middleware, render_metrics
+    from .services.upload_spool import upload_size_middleware
+with startup_report.phase("import:app.api"):
+    from .api.upload import router as upload_router
+    from .api.ask import router as ask_router
+    from .api.export import router as export_router
+
+# DEBUG adds per-call vector store and LLM detail; INFO is startup and lifecycle events
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def _timed(name: str, step) -> None:
+    with startup_report.phase(f"warm:{name}"):
+        await step
+
 
-app = FastAPI(title="LegalLens API", version="0.1.0")
+async def warm_up() -> None:
+    """Create the service clients and start the worker pools ahead of the first request."""
+    steps = [
+        _timed("gemini", asyncio.to_thread(gemini.warm)),
+        _timed("extract_pool", asyncio.to_thread(warm_extract_pool)),
+        _timed("export_pool", get_report_renderer().warm()),
+        # BM25 postings live in memory; reload them for documents ingested before this process
+        _timed("lexical_index", asyncio.to_thread(rebuild_from_registry, get_vector_db())),
+    ]
+    if os.getenv("SUPABASE_URL"):
+        steps.append(_timed("supabase", asyncio.to_thread(supabase.warm)))
+    results = await asyncio.gather(*steps, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Warm-up step failed: %s", result)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared VectorDB once and open its connection pool before traffic arrives
+    with startup_report.phase("startup:vector_db"):
+        vdb = get_vector_db()
+        await asyncio.to_thread(vdb.warm)
+    ingest_queue = get_ingest_queue()
+    await ingest_queue.start(vdb)
+    # Clients and pools are otherwise created on first use; "background" warms
+    # them without delaying readiness, "blocking" finishes before serving
+    warming = None
+    if STARTUP_WARM == "blocking":
+        await warm_up()
+    elif STARTUP_WARM == "background":
+        warming = asyncio.create_task(warm_up())
+    startup_report.mark_ready()
+    yield
+    if warming is not None:
+        warming.cancel()
+    await ingest_queue.stop()
+    shutdown_extract_pool()
+    get_report_renderer().shutdown()
+
+
+app = FastAPI(title="LegalLens API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,27 +90,73 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(upload_size_middleware)
+app.middleware("http")(http_metrics_middleware)
 
 
 @app.get("/health")
-async def health():
-    return {"status": "ok"}
+async def health(vdb: VectorDB = Depends(get_vector_db)):
+    return {
+        "status": "ok",
+        "vector_store": vdb.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "embedding_engine": embedding_engine_stats(),
+        "ingest": get_ingest_queue().stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "lexical_index": get_lexical_index().stats(),
+        "doc_registry": get_doc_registry().stats(),
+        "export": get_report_renderer().stats(),
+        "storage": get_storage().stats(),
+        "startup": startup_report.to_dict(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/docs-list")
-async def docs_list():
-    # Placeholder: not persisted yet
-    return {"docs": []}
+async def docs_list(
+    user_id: str,
+    category: Optional[str] = None,
+    limit: int = DOCS_PAGE_SIZE,
+    offset: int = 0,
+):
+    return await asyncio.to_thread(
+        get_doc_registry().list, user_id=user_id, category=category, limit=limit, offset=offset
+    )
 
 @app.delete("/docs/{doc_id}")
-async def delete_doc(doc_id: str):
+async def delete_doc(doc_id: str, user_id: Optional[str] = None, vdb: VectorDB = Depends(get_vector_db)):
+    registry = get_doc_registry()
+    doc = await asyncio.to_thread(registry.get, doc_id)
+    if doc is None and not user_id:
+        # Ingested before the registry existed: fall back to a metadata-filter delete
+        removed = await asyncio.to_thread(vdb.delete_by_doc, doc_id)
+        if removed == 0:
+            raise HTTPException(status_code=404, detail=f"unknown document {doc_id}")
+        get_lexical_index().delete_by_doc(doc_id)
+        get_answer_cache().invalidate_doc(doc_id)
+        return {"status": "deleted", "doc_id": doc_id, "chunks_deleted": removed}
+    if doc is None or (user_id and doc["user_id"] != user_id):
+        raise HTTPException(status_code=404, detail=f"unknown document {doc_id}")
     try:
-        VectorDB().delete_by_doc(doc_id)
-        # user_id not tracked yet in memory; try best-effort delete path for demo
-        # If you store user_id per doc in DB, fetch it and call delete_pdf(user_id, doc_id)
-        return {"status": "deleted", "doc_id": doc_id}
+        # Every chunk id is known from the registry, so this is a delete by id, not a filter scan
+        ids = chunk_ids(doc)
+        await asyncio.to_thread(vdb.delete_ids, ids)
+        get_lexical_index().delete_ids(ids)
+        get_answer_cache().invalidate_doc(doc_id)
+        await asyncio.to_thread(registry.delete, doc_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    try:
+        await get_storage().delete(doc["user_id"], doc_id)
+    except Exception:
+        # The index no longer references it; an orphaned object is harmless
+        logger.exception("Failed to delete stored PDF for %s", doc_id)
+    return {"status": "deleted", "doc_id": doc_id, "chunks_deleted": len(ids)}
 
 
 app.include_router(upload_router)
@@ -0,0 +1,295 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+# "ivf" (exact scores within probed lists) or "ivfpq" (PQ-compressed residuals,
+# exact re-rank of the best candidates); empty disables the ANN path
+VECTOR_ANN = os.getenv("VECTOR_ANN", "")
+# Train once the local index holds this many vectors; below it exact search is fast enough
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "50000"))
+# Queries whose filters leave fewer candidates than this stay exact
+ANN_MIN_CANDIDATES = int(os.getenv("ANN_MIN_CANDIDATES", "20000"))
+# Coarse lists (0: about sqrt(rows) at training time) and lists probed per query
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# PQ sub-quantizers (must divide the dimension) and candidates re-ranked per result
+ANN_PQ_M = int(os.getenv("ANN_PQ_M", "64"))
+ANN_RERANK = int(os.getenv("ANN_RERANK", "16"))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "65536"))
+ANN_KMEANS_ITERS = int(os.getenv("ANN_KMEANS_ITERS", "10"))
+
+# Rows assigned per lock hold while (re)building
+_ASSIGN_BLOCK = 16384
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over an owner's row matrix (unit-norm float32).
+    A spherical k-means coarse quantizer maps every row to a list; a query
+    scores only the rows in its `nprobe` closest lists. With PQ, residuals are
+    stored as m uint8 codes, candidates are scored from lookup tables, and the
+    best `rerank * k` are re-scored exactly against the matrix.
+
+    The index keeps one list id per owner row (-1 while unassigned; such
+    rows are always scored, so results stay correct while assignment catches
+    up). Inserts are assigned as they arrive once the quantizer is trained.
+    """
+
+    def __init__(self, pq_m: int = 0, nprobe: int = ANN_NPROBE, nlist: int = ANN_NLIST, rerank: int = ANN_RERANK):
+        self.pq_m = pq_m
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.rerank = rerank
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None   # (m, 256, d / m)
+        self._assign = np.full(0, -1, dtype=np.int32)
+        self._codes: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._n = 0
+        self._building = False
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def stats(self) -> Dict:
+        return {
+            "kind": "ivfpq" if self.pq_m else "ivf",
+            "trained": self.trained,
+            "lists": len(self.centroids) if self.trained else 0,
+            "nprobe": self.nprobe,
+            "unassigned": int((self._assign[:self._n] == -1).sum()),
+        }
+
+    def pending(self) -> bool:
+        """Whether some rows still wait for a list assignment."""
+        return bool((self._assign[:self._n] == -1).any())
+
+    # --- training -------------------------------------------------------------
+
+    def train(self, sample: np.ndarray, n_rows: Optional[int] = None, seed: int = 0) -> None:
+        """Fit the coarse quantizer (and PQ codebooks) on a sample of an index of n_rows."""
+        rng = np.random.default_rng(seed)
+        nlist = min(self.nlist or max(16, int(np.sqrt(n_rows or len(sample)))), len(sample))
+        centroids = _spherical_kmeans(sample, nlist, ANN_KMEANS_ITERS, rng)
+        codebooks = None
+        if self.pq_m:
+            dim = sample.shape[1]
+            if dim % self.pq_m:
+                raise ValueError(f"ANN_PQ_M={self.pq_m} does not divide dimension {dim}")
+            # 64 points per code word is plenty for 256-entry sub-codebooks
+            sub = sample[rng.choice(len(sample), min(len(sample), 256 * 64), replace=False)]
+            labels = np.argmax(sub @ centroids.T, axis=1)
+            residuals = (sub - centroids[labels]).reshape(len(sub), self.pq_m, -1)
+            codebooks = np.stack([
+                _kmeans(np.ascontiguousarray(residuals[:, j]), min(256, len(sub)), ANN_KMEANS_ITERS, rng)
+                for j in range(self.pq_m)
+            ])
+        # codebooks first: `trained` (centroids set) implies PQ is ready too
+        self.codebooks = codebooks
+        self.centroids = centroids
+
+    def build_async(self, lock, rows: Callable[[], np.ndarray]) -> None:
+        """
+        Train on a sample of `rows()` in a background thread, then assign every
+        unassigned row a block at a time, taking `lock` for each block.
+        """
+        if self._building:
+            return
+        self._building = True
+
+        def run():
+            try:
+                if not self.trained:
+                    with lock:
+                        matrix = rows()
+                        pick = np.random.default_rng(0).choice(
+                            len(matrix), min(len(matrix), ANN_TRAIN_SAMPLE), replace=False
+                        )
+                        sample = np.array(matrix[np.sort(pick)])
+                    self.train(sample, len(matrix))
+                    logger.info("ANN index trained: %d lists, pq_m=%d", len(self.centroids), self.pq_m)
+                while True:
+                    with lock:
+                        matrix = rows()
+                        self.resize(len(matrix))
+                        todo = np.flatnonzero(self._assign[:len(matrix)] == -1)[:_ASSIGN_BLOCK]
+                        if todo.size == 0:
+                            break
+                        self._set(todo, np.asarray(matrix[todo]))
+            except Exception:
+                logger.exception("ANN index build failed")
+            finally:
+                self._building = False
+
+        threading.Thread(target=run, name="ann-build", daemon=True).start()
+
+    # --- row bookkeeping (called by the owner under its lock) -----------------
+
+    def resize(self, n: int) -> None:
+        if n > len(self._assign):
+            capacity = max(n, 2 * len(self._assign), 1024)
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+            if self._codes is not None:
+                codes = np.zeros((capacity, self._codes.shape[1]), dtype=np.uint8)
+                codes[:len(self._codes)] = self._codes
+                self._codes = codes
+        self._n = n
+
+    def set_rows(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Rows were written (inserted or overwritten) with these unit vectors."""
+        self.resize(max(int(rows.max()) + 1, self._n))
+        if self.trained:
+            self._set(rows, vectors)
+        else:
+            self._assign[rows] = -1
+
+    def move(self, src: int, dst: int) -> None:
+        self._assign[dst] = self._assign[src]
+        if self._codes is not None:
+            self._codes[dst] = self._codes[src]
+        self._assign[src] = -1
+        self._order = None
+
+    def truncate(self, n: int) -> None:
+        self._assign[n:] = -1
+        self._n = n
+        self._order = None
+
+    def reset_rows(self, n: int = 0) -> None:
+        """Forget every assignment (rows were renumbered); keeps the trained quantizer."""
+        self._assign = np.full(0, -1, dtype=np.int32)
+        self._codes = None
+        self._order = None
+        self.resize(n)
+
+    def _set(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        labels = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self._assign[rows] = labels
+        if self.codebooks is not None:
+            if self._codes is None:
+                self._codes = np.zeros((len(self._assign), self.pq_m), dtype=np.uint8)
+            self._codes[rows] = self._encode(vectors - self.centroids[labels])
+        self._order = None
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        sub = residuals.reshape(len(residuals), self.pq_m, -1)
+        codes = np.empty((len(residuals), self.pq_m), dtype=np.uint8)
+        for j in range(self.pq_m):
+            book = self.codebooks[j]
+            dist = (book * book).sum(1) - 2 * sub[:, j] @ book.T
+            codes[:, j] = np.argmin(dist, axis=1)
+        return codes
+
+    # --- search ---------------------------------------------------------------
+
+    def search(self, q: np.ndarray, matrix: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+               nprobe: Optional[int] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (rows, exact scores) of the best k rows in the probed lists, restricted
+        to `mask` when given. None when the probed lists hold fewer than k
+        candidates, so the caller can fall back to exact search.
+        """
+        if not self.trained or k <= 0:
+            return None
+        n = len(matrix)
+        if self._order is None:
+            assign = self._assign[:n]
+            self._order = np.argsort(assign, kind="stable").astype(np.int64)
+            self._offsets = np.searchsorted(assign[self._order], np.arange(len(self.centroids) + 1))
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        coarse = self.centroids @ q
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        parts = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe]
+        parts.append(self._order[:self._offsets[0]])  # unassigned rows
+        cand = np.concatenate(parts)
+        cand = cand[cand < n]
+        if mask is not None:
+            cand = cand[mask[cand]]
+        if cand.size < k:
+            return None
+
+        if self.codebooks is not None:
+            # Unassigned rows have no codes and are always re-ranked exactly
+            assigned = self._assign[cand] >= 0
+            ac = cand[assigned]
+            keep = k * self.rerank
+            if ac.size > keep:
+                # Lookup table of q against every code word; score = q.centroid + sum of table entries
+                tables = np.einsum("mkd,md->mk", self.codebooks, q.reshape(self.pq_m, -1))
+                flat = (self._codes[ac] + np.arange(self.pq_m, dtype=np.int32) * tables.shape[1]).ravel()
+                approx = coarse[self._assign[ac]] + tables.ravel()[flat].reshape(-1, self.pq_m).sum(1)
+                cand = np.concatenate([cand[~assigned], ac[np.argpartition(-approx, keep - 1)[:keep]]])
+
+        cand = np.sort(cand)  # ascending rows: sequential reads from a memory map
+        scores = np.asarray(matrix[cand] @ q)
+        best = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return cand[best], scores[best]
+
+
+def make_ann() -> Optional[IVFIndex]:
+    if VECTOR_ANN == "ivf":
+        return IVFIndex()
+    if VECTOR_ANN == "ivfpq":
+        return IVFIndex(pq_m=ANN_PQ_M)
+    return None
+
+
+def ann_search(ann: Optional[IVFIndex], q: np.ndarray, matrix: np.ndarray, rows: Optional[np.ndarray],
+               k: int, alive: Optional[np.ndarray] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    The ANN answer for a query over `rows` of `matrix` (None: every row, or
+    every `alive` row), or None when the query should be searched exactly:
+    no trained index, or too few candidates for the approximation to pay off.
+    """
+    if ann is None or not ann.trained:
+        return None
+    if rows is None:
+        size = len(matrix) if alive is None else int(alive.sum())
+        mask = alive
+    else:
+        size = rows.size
+        mask = np.zeros(len(matrix), dtype=bool)
+        mask[rows] = True
+    if size < ANN_MIN_CANDIDATES:
+        return None
+    return ann.search(q, matrix, k, mask)
+
+
+def _spherical_kmeans(x: np.ndarray, k: int, iters: int, rng) -> np.ndarray:
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmax(x @ centroids.T, axis=1)
+        sums = _sum_by_label(x, labels, k)
+        empty = ~sums.any(axis=1)
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-9)
+    return centroids.astype(np.float32)
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng) -> np.ndarray:
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmin((centroids * centroids).sum(1) - 2 * x @ centroids.T, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = _sum_by_label(x, labels, k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids.astype(np.float32)
+
+
+def _sum_by_label(x: np.ndarray, labels: np.ndarray, k: int) -> np.ndarray:
+    order = np.argsort(labels, kind="stable")
+    present, starts = np.unique(labels[order], return_index=True)
+    sums = np.zeros((k, x.shape[1]), dtype=np.float32)
+    sums[present] = np.add.reduceat(x[order], starts, axis=0)
+    return sums
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+import numpy as np
+
+from .metrics import count_cache
+
+# A cached answer is reused when the retrieved context is identical and the
+# question embedding is at least this cosine-similar to the cached question
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Buckets for the best similarity seen on misses that had a context match;
+# shows how many more hits a lower threshold would give
+_NEAR_MISS_BUCKETS = (0.80, 0.85, 0.90, 0.93, 0.95, 0.97, 0.99)
+
+
+class _Entry:
+    __slots__ = ("qvec", "context", "versions", "answer", "created")
+
+    def __init__(self, qvec: np.ndarray, context: FrozenSet[str], versions: Dict[str, Optional[float]], answer: str):
+        self.qvec = qvec
+        self.context = context
+        self.versions = versions
+        self.answer = answer
+        self.created = time.time()
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers. Entries are grouped by the exact set
+    of retrieved chunk ids, and record the registry version of every document
+    they drew on: a lookup drops entries whose documents have since been
+    deleted or re-uploaded, including by another worker process.
+    invalidate_doc frees them at once in the process that made the change.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_context: Dict[FrozenSet[str], Set[str]] = {}
+        self._by_doc: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._near_misses = {b: 0 for b in _NEAR_MISS_BUCKETS}
+
+    def lookup(self, qvec: List[float], context_ids: Iterable[str],
+               versions: Dict[str, Optional[float]]) -> Optional[str]:
+        """versions: current registry version of every document the answer would depend on."""
+        context = frozenset(context_ids)
+        q = _unit(qvec)
+        now = time.time()
+        with self._lock:
+            best_id, best_sim = None, -1.0
+            for entry_id in list(self._by_context.get(context, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                if any(d in versions and versions[d] != v for d, v in entry.versions.items()):
+                    self._remove(entry_id)
+                    self.invalidated += 1
+                    continue
+                # Asked over other documents; same retrieved chunks, but not known to be current
+                if not entry.versions.keys() <= versions.keys():
+                    continue
+                sim = float(entry.qvec @ q)
+                if sim > best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is not None and best_sim >= self.threshold:
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+                count_cache("answer", "hit")
+                return self._entries[best_id].answer
+            self.misses += 1
+            count_cache("answer", "miss")
+            if best_id is not None:
+                for b in _NEAR_MISS_BUCKETS:
+                    if best_sim >= b:
+                        self._near_misses[b] += 1
+            return None
+
+    def store(self, qvec: List[float], context_ids: Iterable[str], versions: Dict[str, Optional[float]],
+              answer: str) -> None:
+        """versions: as passed to the lookup that missed, read before the answer was generated."""
+        entry = _Entry(_unit(qvec), frozenset(context_ids), dict(versions), answer)
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[entry_id] = entry
+            self._by_context.setdefault(entry.context, set()).add(entry_id)
+            for doc_id in entry.versions:
+                self._by_doc.setdefault(doc_id, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_doc(self, doc_id: str) -> int:
+        with self._lock:
+            ids = self._by_doc.pop(doc_id, set())
+            for entry_id in ids:
+                self._remove(entry_id)
+            self.invalidated += len(ids)
+            return len(ids)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidated": self.invalidated,
+            # misses whose closest same-context question scored >= bucket
+            "near_misses": {str(b): n for b, n in self._near_misses.items()},
+        }
+
+    def _remove(self, entry_id: str) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        peers = self._by_context.get(entry.context)
+        if peers is not None:
+            peers.discard(entry_id)
+            if not peers:
+                del self._by_context[entry.context]
+        for doc_id in entry.versions:
+            refs = self._by_doc.get(doc_id)
+            if refs is not None:
+                refs.discard(entry_id)
+                if not refs:
+                    del self._by_doc[doc_id]
+
+
+def _unit(vec: List[float]) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    return v / (np.linalg.norm(v) + 1e-9)
+
+
+_cache = AnswerCache()
+
+
+def get_answer_cache() -> AnswerCache:
+    return _cache
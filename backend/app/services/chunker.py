@@ -1,87 +1,225 @@
-from typing import List, Dict, Tuple
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+# Chunks close once they reach the target; a chunk still under the minimum may
+# take a whole clause up to the hard maximum rather than cut it
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "800"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "400"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "1000"))
+# Trailing text repeated at the start of the next chunk (whole clauses/sentences only)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+# A final chunk smaller than this is folded into the one before it
+CHUNK_TAIL_MERGE_TOKENS = int(os.getenv("CHUNK_TAIL_MERGE_TOKENS", "250"))
+# "words" (~0.75 words per token), "chars" (~4 characters per token), or
+# "sentencepiece" with CHUNK_TOKENIZER_MODEL pointing at the model file
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "words")
+CHUNK_TOKENIZER_MODEL = os.getenv("CHUNK_TOKENIZER_MODEL")
 
-def estimate_tokens(text: str) -> int:
+logger = logging.getLogger(__name__)
+
+# Clause / section numbering at the start of a line: "Section 4(a)", "Article IV",
+# "1.", "1.2", "2.3.1", "4)", "(a)", "(iv)", "(12)"
+_BOUNDARY_RE = re.compile(
+    r"^\s*(?P<label>"
+    r"(?P<major>(?:section|sec\.|article|clause|schedule|annex(?:ure)?|exhibit|appendix)\s+[0-9ivxlc]+(?:\.\d+)*(?:\([0-9a-z]+\))*"
+    r"|\d+[.)](?=\s))"
+    r"|\d+(?:\.\d+)+\.?(?=\s)"
+    r"|\((?:[a-z]{1,2}|[ivx]{1,5}|\d{1,3})\)"
+    r")",
+    re.IGNORECASE,
+)
+_SENTENCE_RE = re.compile(r"(?<=[.;:?!])\s+(?=[A-Z0-9(\"'])")
+
+
+def _count_words(text: str) -> int:
     # Simple heuristic: ~0.75 words per token
     words = len(text.split())
     return int(words / 0.75) if words else 0
 
 
+def _count_chars(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _load_tokenizer(name: str) -> Callable[[str], int]:
+    if name == "chars":
+        return _count_chars
+    if name == "sentencepiece":
+        try:
+            import sentencepiece as spm
+
+            sp = spm.SentencePieceProcessor(model_file=CHUNK_TOKENIZER_MODEL)
+            return lambda text: len(sp.encode(text))
+        except Exception as e:
+            logger.warning("sentencepiece tokenizer unavailable (%s); using word estimate", e)
+    return _count_words
+
+
+_count = _load_tokenizer(CHUNK_TOKENIZER)
+
+
+def set_tokenizer(count: Callable[[str], int]) -> None:
+    """Use `count(text) -> tokens` for chunk sizes and token estimates everywhere."""
+    global _count
+    _count = count
+
+
+def estimate_tokens(text: str) -> int:
+    return _count(text)
+
+
 def chunk_pages(pages: List[Tuple[int, str]]) -> List[Dict]:
-    chunks: List[Dict] = []
-    buffer: List[str] = []
-    page_start = None
-    token_count = 0
+    return list(iter_chunks(pages))
+
+
+class _Piece:
+    """A clause, or a sentence run of an oversized clause, with its token count."""
+    __slots__ = ("text", "tokens", "page", "label", "major", "joiner")
+
+    def __init__(self, text: str, tokens: int, page: int, label: Optional[str], major: bool, joiner: str):
+        self.text = text
+        self.tokens = tokens
+        self.page = page
+        self.label = label
+        self.major = major
+        self.joiner = joiner  # separator placed before this piece
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], target: int = CHUNK_TARGET_TOKENS,
+                overlap: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Dict]:
+    """
+    Single pass over (page_number, text) pairs. Pages are cut into clauses at
+    numbering such as "1.2" or "Section 4(a)", clauses are packed into chunks
+    with a running token count, and each chunk is yielded as soon as it is
+    final. Every piece of text is tokenized once, so the cost is linear in the
+    document length. One chunk is held back so a small tail can merge into it.
+    """
+    maximum = max(CHUNK_MAX_TOKENS, target)
+    minimum = min(CHUNK_MIN_TOKENS, target)
+    overlap = min(overlap, minimum // 2)
+    # A new top-level section starts a new chunk once the current one is this full
+    section_break = (minimum + target) // 2
+    state = {"pending": None, "next_id": 0}
+    current: List[_Piece] = []
+    carried = 0        # leading pieces of `current` repeated from the previous chunk
+    tokens = 0
+
+    def emit(pieces: List[_Piece], n_carried: int) -> Iterator[Dict]:
+        # Yield the held-back chunk and hold this one back instead
+        pending = state["pending"]
+        state["pending"] = (pieces, n_carried)
+        if pending is not None:
+            yield _make_chunk(pending[0], state["next_id"])
+            state["next_id"] += 1
+
+    def close() -> Iterator[Dict]:
+        nonlocal current, carried, tokens
+        yield from emit(current, carried)
+        # Carry whole trailing pieces, up to `overlap` tokens, into the next chunk
+        tail: List[_Piece] = []
+        size = 0
+        for piece in reversed(current[carried:]):
+            if size + piece.tokens > overlap:
+                break
+            tail.insert(0, piece)
+            size += piece.tokens
+        current, carried, tokens = tail, len(tail), size
+
     for page_num, text in pages:
-        paragraphs = [p for p in text.split("\n\n") if p.strip()]
-        for para in paragraphs:
-            if page_start is None:
-                page_start = page_num
-            t = estimate_tokens(para)
-            if token_count + t <= 800:
-                buffer.append(para)
-                token_count += t
-            else:
-                if token_count < 400 and buffer:
-                    buffer.append(para)
-                    token_count += t
-                chunk_text = "\n\n".join(buffer).strip()
-                if chunk_text:
-                    chunks.append({
-                        "text": chunk_text,
-                        "page_start": page_start,
-                        "page_end": page_num,
-                        "tokens": token_count,
-                    })
-                buffer = [para]
-                token_count = estimate_tokens(para)
-                page_start = page_num
+        for unit in _iter_units(page_num, text, target, maximum):
+            fresh = len(current) > carried
+            if fresh and (
+                (unit[0].major and tokens >= section_break)
+                or (tokens >= minimum and tokens + sum(p.tokens for p in unit) > target)
+            ):
+                yield from close()
+            for piece in unit:
+                limit = target if tokens >= minimum else maximum
+                if len(current) > carried and tokens + piece.tokens > limit:
+                    yield from close()
+                if tokens + piece.tokens > maximum:
+                    current, carried, tokens = [], 0, 0  # no room left for the overlap
+                current.append(piece)
+                tokens += piece.tokens
+
     # finalize
-    if buffer:
-        if chunks and estimate_tokens("\n\n".join(buffer)) < 250:
+    pending = state["pending"]
+    if len(current) > carried:
+        fresh = current[carried:]
+        fresh_tokens = sum(p.tokens for p in fresh)
+        if (pending is not None and fresh_tokens < CHUNK_TAIL_MERGE_TOKENS
+                and sum(p.tokens for p in pending[0]) + fresh_tokens <= maximum):
             # merge small last chunk
-            prev = chunks[-1]
-            prev["text"] = (prev["text"] + "\n\n" + "\n\n".join(buffer)).strip()
-            prev["page_end"] = prev["page_end"]  # unchanged
-            prev["tokens"] = estimate_tokens(prev["text"])
+            state["pending"] = (pending[0] + fresh, pending[1])
         else:
-            chunks.append({
-                "text": "\n\n".join(buffer).strip(),
-                "page_start": page_start or 1,
-                "page_end": pages[-1][0] if pages else 1,
-                "tokens": estimate_tokens("\n\n".join(buffer)),
-            })
-    # Cap to 1000 tokens per chunk by naive split if needed
-    normalized: List[Dict] = []
-    for ch in chunks:
-        if ch["tokens"] <= 1000:
-            normalized.append(ch)
-        else:
-            parts = _split_large_chunk(ch["text"], 1000)
-            for p in parts:
-                normalized.append({
-                    "text": p,
-                    "page_start": ch["page_start"],
-                    "page_end": ch["page_end"],
-                    "tokens": estimate_tokens(p),
-                })
-    return [
-        {**c, "chunk_id": i}
-        for i, c in enumerate(normalized)
-    ]
-
-
-def _split_large_chunk(text: str, max_tokens: int) -> List[str]:
-    words = text.split()
-    out: List[str] = []
+            yield from emit(current, carried)
+    if state["pending"] is not None:
+        yield _make_chunk(state["pending"][0], state["next_id"])
+
+
+def _iter_units(page_num: int, text: str, target: int, maximum: int) -> Iterator[List[_Piece]]:
+    """Clauses on one page; a clause over `maximum` comes back as pieces of about `target`."""
+    lines: List[str] = []
+    match = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = _BOUNDARY_RE.match(line)
+        if m and lines:
+            yield _pieces(page_num, "\n".join(lines), match, target, maximum)
+            lines = []
+        if m or not lines:
+            match = m
+        lines.append(line)
+    if lines:
+        yield _pieces(page_num, "\n".join(lines), match, target, maximum)
+
+
+def _pieces(page_num: int, text: str, match, target: int, maximum: int) -> List[_Piece]:
+    label = match.group("label").strip() if match else None
+    major = bool(match and match.group("major"))
+    tokens = _count(text)
+    if tokens <= maximum:
+        return [_Piece(text, tokens, page_num, label, major, "\n")]
+    # Oversized clause: pack its sentences, and split runaway sentences by word windows
+    out: List[_Piece] = []
     buf: List[str] = []
-    for w in words:
-        buf.append(w)
-        if estimate_tokens(" ".join(buf)) >= max_tokens:
-            out.append(" ".join(buf))
-            buf = []
+    size = 0
+    for sentence in _SENTENCE_RE.split(text):
+        t = _count(sentence)
+        parts = [(sentence, t)] if t <= target else _split_words(sentence, t, target)
+        for part, pt in parts:
+            if buf and size + pt > target:
+                out.append(_Piece(" ".join(buf), size, page_num, label, major and not out, "\n" if not out else " "))
+                buf, size = [], 0
+            buf.append(part)
+            size += pt
     if buf:
-        out.append(" ".join(buf))
+        out.append(_Piece(" ".join(buf), size, page_num, label, major and not out, "\n" if not out else " "))
+    return out
+
+
+def _split_words(text: str, tokens: int, target: int) -> List[Tuple[str, int]]:
+    # Window size from the sentence's average tokens per word: one count per window
+    words = text.split()
+    per_window = max(1, int(len(words) * target / max(tokens, 1)))
+    out = []
+    for start in range(0, len(words), per_window):
+        part = " ".join(words[start:start + per_window])
+        out.append((part, _count(part)))
     return out
 
 
+def _make_chunk(pieces: List[_Piece], chunk_id: int) -> Dict:
+    text = pieces[0].text + "".join(p.joiner + p.text for p in pieces[1:])
+    return {
+        "text": text,
+        "page_start": pieces[0].page,
+        "page_end": pieces[-1].page,
+        "tokens": _count(text),
+        "section": next((p.label for p in pieces if p.label), None),
+        "chunk_id": chunk_id,
+    }
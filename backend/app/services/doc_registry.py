@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .vector_db import get_vector_db
+
+# postgresql://... uses Postgres through psycopg; otherwise a local SQLite file.
+# Neither is used with the in-memory vector store: rows would outlive its vectors.
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DOC_REGISTRY_PATH = os.getenv(
+    "DOC_REGISTRY_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "doc_registry.sqlite"),
+)
+DOCS_PAGE_SIZE = 50
+DOCS_PAGE_MAX = 500
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = (
+    "doc_id", "user_id", "category", "filename", "content_hash",
+    "pages", "chunks_count", "timings", "created_at", "updated_at",
+)
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS documents (
+        doc_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        pages INTEGER NOT NULL,
+        chunks_count INTEGER NOT NULL,
+        timings TEXT,
+        created_at DOUBLE PRECISION NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS documents_user_idx ON documents (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS documents_category_idx ON documents (category, created_at)",
+)
+
+
+class DocRegistry:
+    """
+    One row per ingested document: owner, category, content hash, page and
+    chunk counts and the ingest stage timings. Chunk vector ids are
+    "{doc_id}_chunk_{n}" for n < chunks_count, so a row is enough to delete
+    a document's vectors and its stored PDF without scanning anything.
+    """
+
+    def __init__(self, url: str = DATABASE_URL, path: str = DOC_REGISTRY_PATH):
+        self._lock = threading.Lock()
+        if url.startswith(("postgres://", "postgresql://")):
+            import psycopg
+
+            self.backend = "postgres"
+            self._conn = psycopg.connect(url, autocommit=True)
+            self._param = "%s"
+        else:
+            self.backend = "sqlite"
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._param = "?"
+        for stmt in _SCHEMA:
+            self._execute(stmt)
+
+    def record(self, doc_id: str, user_id: str, category: str, filename: str, content_hash: str,
+               pages: int, chunks_count: int, timings: Optional[Dict] = None) -> Optional[Dict]:
+        """Insert or replace a document row; returns the row it replaced, if any."""
+        now = time.time()
+        previous = self.get(doc_id)
+        self._execute(
+            f"INSERT INTO documents ({', '.join(_COLUMNS)}) VALUES ({', '.join([self._param] * len(_COLUMNS))}) "
+            "ON CONFLICT (doc_id) DO UPDATE SET user_id = excluded.user_id, category = excluded.category, "
+            "filename = excluded.filename, content_hash = excluded.content_hash, pages = excluded.pages, "
+            "chunks_count = excluded.chunks_count, timings = excluded.timings, updated_at = excluded.updated_at",
+            (doc_id, user_id, category, filename, content_hash, pages, chunks_count,
+             json.dumps(timings) if timings is not None else None,
+             previous["created_at"] if previous else now, now),
+        )
+        return previous
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM documents WHERE doc_id = {self._param}", (doc_id,))
+        return rows[0] if rows else None
+
+    def versions(self, doc_ids: Iterable[str]) -> Dict[str, Optional[float]]:
+        """
+        updated_at of each document, None for unregistered ones. It changes on
+        every re-ingest and delete, in whichever process made the change.
+        """
+        ids = list(doc_ids)
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, updated_at FROM documents WHERE doc_id IN ({', '.join([self._param] * len(ids))})",
+                ids,
+            ).fetchall()
+        found = dict(rows)
+        return {doc_id: found.get(doc_id) for doc_id in ids}
+
+    def list(self, user_id: Optional[str] = None, category: Optional[str] = None,
+             limit: int = DOCS_PAGE_SIZE, offset: int = 0) -> Dict:
+        """Newest first, filtered by owner and/or category."""
+        where, params = [], []
+        if user_id:
+            where.append(f"user_id = {self._param}")
+            params.append(user_id)
+        if category:
+            where.append(f"category = {self._param}")
+            params.append(category)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        limit = max(1, min(limit, DOCS_PAGE_MAX))
+        offset = max(0, offset)
+        docs = self._query(
+            f"SELECT {', '.join(_COLUMNS)} FROM documents{clause} "
+            f"ORDER BY created_at DESC, doc_id LIMIT {self._param} OFFSET {self._param}",
+            (*params, limit, offset),
+        )
+        total = self._scalar(f"SELECT COUNT(*) FROM documents{clause}", params)
+        return {
+            "docs": docs,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + len(docs) if offset + len(docs) < total else None,
+        }
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute(f"DELETE FROM documents WHERE doc_id = {self._param}", (doc_id,))
+            return cur.rowcount > 0
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "documents": self._scalar("SELECT COUNT(*) FROM documents", ())}
+
+    def _execute(self, sql: str, params=()) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        out = []
+        for row in rows:
+            doc = dict(zip(_COLUMNS, row))
+            doc["timings"] = json.loads(doc["timings"]) if doc["timings"] else None
+            out.append(doc)
+        return out
+
+    def _scalar(self, sql: str, params) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+
+def chunk_ids(doc: Dict, start: int = 0) -> List[str]:
+    """Vector ids of a registered document's chunks, from chunk `start` on."""
+    return [f"{doc['doc_id']}_chunk_{n}" for n in range(start, doc["chunks_count"])]
+
+
+_registry: Optional[DocRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_doc_registry() -> DocRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _default_registry()
+    return _registry
+
+
+def _default_registry() -> DocRegistry:
+    # A row must not outlive the vectors it describes; the in-process store is gone on restart
+    if get_vector_db().backend == "memory":
+        logger.info("In-memory vector store: keeping the document registry in memory too")
+        return DocRegistry(url="", path=":memory:")
+    return DocRegistry()
@@ -1,47 +1,314 @@
+import hashlib
+import logging
 import os
-from typing import List
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 from dotenv import load_dotenv
 
-load_dotenv()
+from .chunker import estimate_tokens
+from .metrics import count_cache
+from .providers import get_gemini_client
 
-try:
-    from google import genai
-    from google.genai import types
-except Exception:  # pragma: no cover
-    genai = None
-    types = None
+load_dotenv()
 
 # Set to match Pinecone index
-EMBED_DIM = 768  
+EMBED_DIM = 768
+# Same model /upload embeds chunks with, so questions and chunks share a space
+EMBED_MODEL = os.getenv("GEMINI_EMBED_MODEL", "gemini-embedding-001")
 
-# Keep global client
-client = None
+# Query embedding cache: in-memory LRU, plus an optional SQLite file that survives restarts
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL_SECONDS = float(os.getenv("EMBED_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")
 
-def init_gemini() -> bool:
-    global client
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key and genai:
-        client = genai.Client(api_key=api_key)
-        return True
-    return False
+# Chunk embedding store keyed by content hash; boilerplate clauses and re-uploads
+# reuse stored vectors. Set CHUNK_STORE_PATH="" to keep it in memory only.
+CHUNK_STORE_SIZE = int(os.getenv("CHUNK_STORE_SIZE", "50000"))
+CHUNK_STORE_PATH = os.getenv(
+    "CHUNK_STORE_PATH", os.path.join(tempfile.gettempdir(), "legal-lens-chunk-embeddings.sqlite")
+)
 
+# Request shaping: texts and estimated tokens per embed_content call
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "100"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "16000"))
+# Batches in flight across the whole process, and retry policy for quota/transient errors
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "1.0"))
+EMBED_BACKOFF_MAX_SECONDS = float(os.getenv("EMBED_BACKOFF_MAX_SECONDS", "30"))
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    global client
-    if client and genai:
-        try:
-            result = client.models.embed_content(
-                model="models/embedding-001",   # ✅ correct model name
-                contents=texts,
-                config=types.EmbedContentConfig(output_dimensionality=EMBED_DIM),
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of embedding vectors with per-entry TTL and hit/miss counters.
+    If `path` is given, entries are written through to a SQLite table and
+    looked up there on an in-memory miss.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, path: Optional[str] = None, name: str = "embedding"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, created REAL NOT NULL, vec BLOB NOT NULL)"
             )
-            return [e.values for e in result.embeddings]
-        except Exception as e:
-            print(f"Error embedding via Gemini: {e}")
-            return [_mock_embed(t) for t in texts]
+            self._db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - ttl_seconds,))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    count_cache(self.name, "hit")
+                    return entry[1]
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT created, vec FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row and now - row[0] <= self.ttl_seconds:
+                    vec = np.frombuffer(row[1], dtype=np.float32).tolist()
+                    self._remember(key, row[0], vec)
+                    self.disk_hits += 1
+                    count_cache(self.name, "disk_hit")
+                    return vec
+            self.misses += 1
+            count_cache(self.name, "miss")
+            return None
+
+    def put(self, key: str, vec: List[float]) -> None:
+        self.put_many([(key, vec)])
+
+    def put_many(self, items: List[Tuple[str, List[float]]]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, vec in items:
+                self._remember(key, now, list(vec))
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, created, vec) VALUES (?, ?, ?)",
+                    [(key, now, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items],
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "persistent": self._db is not None,
+        }
+
+    def _remember(self, key: str, created: float, vec: List[float]) -> None:
+        self._entries[key] = (created, vec)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_query_cache = EmbeddingCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL_SECONDS, EMBED_CACHE_PATH, name="query_embedding")
+_chunk_store = EmbeddingCache(CHUNK_STORE_SIZE, float("inf"), CHUNK_STORE_PATH or None, name="chunk_embedding")
+
+
+def query_cache_key(text: str) -> str:
+    # Case and whitespace don't change what a question asks
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    return hashlib.sha256(f"{EMBED_MODEL}|{EMBED_DIM}|{normalized}".encode("utf-8")).hexdigest()
+
+
+def chunk_key(text: str) -> str:
+    return hashlib.sha256(f"{EMBED_MODEL}|{EMBED_DIM}|{text}".encode("utf-8")).hexdigest()
+
+
+def embedding_cache_stats() -> Dict:
+    return {"query": _query_cache.stats(), "chunks": _chunk_store.stats()}
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    keys = [query_cache_key(t) for t in texts]
+    out: List[Optional[List[float]]] = [_query_cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        vectors, from_model = _embed_uncached([texts[i] for i in missing])
+        for i, vec in zip(missing, vectors):
+            out[i] = vec
+            # Mock vectors are cheap and not comparable with real ones; never cache them
+            if from_model:
+                _query_cache.put(keys[i], vec)
+    return out  # type: ignore[return-value]
+
+
+def embed_chunks(texts: List[str]) -> Tuple[List[List[float]], int]:
+    """
+    Embed document chunks, reusing stored vectors for chunks whose exact text
+    was embedded before. Returns (vectors, number served from the store).
+    """
+    keys = [chunk_key(t) for t in texts]
+    out: List[Optional[List[float]]] = [_chunk_store.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        vectors, from_model = _embed_uncached([texts[i] for i in missing])
+        for i, vec in zip(missing, vectors):
+            out[i] = vec
+        if from_model:
+            _chunk_store.put_many([(keys[i], vec) for i, vec in zip(missing, vectors)])
+    return out, len(texts) - len(missing)  # type: ignore[return-value]
+
+
+def _embed_uncached(texts: List[str]) -> Tuple[List[List[float]], bool]:
+    """
+    Embed with Gemini when a key is configured, otherwise with local mock
+    vectors (dev without keys). Gemini failures raise EmbeddingError; real
+    and mock vectors are never mixed.
+    """
+    client = get_gemini_client()
+    if client is not None:
+        return _engine.embed(client, texts), True
     # fallback
-    return [_mock_embed(t) for t in texts]
+    return [_mock_embed(t) for t in texts], False
+
+
+class _EmbeddingEngine:
+    """
+    Splits inputs into batches bounded by count and estimated tokens, runs up
+    to EMBED_CONCURRENCY of them at once across every caller in the process,
+    and retries quota and transient errors with jittered exponential backoff.
+    """
+
+    def __init__(self):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Held for each embed_content call, whichever thread makes it (single
+        # batches run on the caller's thread, larger calls on the pool)
+        self._slots = threading.BoundedSemaphore(EMBED_CONCURRENCY)
+        self._latencies: "deque[float]" = deque(maxlen=1000)
+        self.batches = 0
+        self.retries = 0
+        self.failures = 0
+
+    def embed(self, client, texts: List[str]) -> List[List[float]]:
+        batches = _make_batches(texts)
+        if len(batches) == 1:
+            results = [self._embed_batch(client, batches[0])]
+        else:
+            results = list(self._executor().map(lambda b: self._embed_batch(client, b), batches))
+        return [vec for batch in results for vec in batch]
+
+    def stats(self) -> Dict:
+        lat = sorted(self._latencies)
+        return {
+            "batches": self.batches,
+            "retries": self.retries,
+            "failures": self.failures,
+            "batch_ms_p50": _percentile_ms(lat, 0.50),
+            "batch_ms_p95": _percentile_ms(lat, 0.95),
+        }
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+            return self._pool
+
+    def _embed_batch(self, client, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    t0 = time.perf_counter()
+                    result = client.models.embed_content(
+                        model=EMBED_MODEL,
+                        contents=texts,
+                        config={"output_dimensionality": EMBED_DIM},
+                    )
+                vectors = [e.values for e in result.embeddings]
+                if len(vectors) != len(texts):
+                    raise EmbeddingError(f"Gemini returned {len(vectors)} embeddings for {len(texts)} texts")
+            except Exception as e:
+                if attempt < EMBED_MAX_RETRIES and _is_retryable(e):
+                    delay = min(EMBED_BACKOFF_MAX_SECONDS, EMBED_BACKOFF_SECONDS * 2 ** attempt)
+                    delay *= random.uniform(0.5, 1.0)
+                    attempt += 1
+                    with self._lock:
+                        self.retries += 1
+                    logger.warning("Embedding batch of %d failed (%s); retry %d in %.1fs", len(texts), e, attempt, delay)
+                    time.sleep(delay)
+                    continue
+                with self._lock:
+                    self.failures += 1
+                if isinstance(e, EmbeddingError):
+                    raise
+                raise EmbeddingError(f"Gemini embedding failed: {e}") from e
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.batches += 1
+                self._latencies.append(elapsed)
+            logger.debug("Embedded batch of %d texts in %.0f ms", len(texts), elapsed * 1000)
+            return vectors
+
+
+def _make_batches(texts: List[str]) -> List[List[str]]:
+    batches: List[List[str]] = []
+    current: List[str] = []
+    tokens = 0
+    for t in texts:
+        n = estimate_tokens(t)
+        if current and (len(current) >= EMBED_BATCH_MAX_TEXTS or tokens + n > EMBED_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(t)
+        tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _percentile_ms(sorted_seconds: List[float], q: float) -> Optional[float]:
+    if not sorted_seconds:
+        return None
+    return round(sorted_seconds[min(len(sorted_seconds) - 1, int(q * len(sorted_seconds)))] * 1000, 1)
+
+
+def _is_retryable(e: Exception) -> bool:
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if code in (408, 429, 500, 502, 503, 504):
+        return True
+    msg = str(e).upper()
+    return any(s in msg for s in ("RESOURCE_EXHAUSTED", "QUOTA", "RATE LIMIT", "UNAVAILABLE", "DEADLINE_EXCEEDED", "TIMED OUT"))
+
+
+_engine = _EmbeddingEngine()
+
+
+def embedding_engine_stats() -> Dict:
+    return _engine.stats()
 
 
 def _mock_embed(text: str) -> List[float]:
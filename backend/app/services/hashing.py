@@ -0,0 +1,22 @@
+import hashlib
+import uuid
+
+# Fixed namespace so the same (user, content) pair always maps to the same doc_id
+DOC_ID_NAMESPACE = uuid.UUID("6f1c2a52-8f0e-4a8e-9c57-3b6d1f0e7a41")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def new_content_hasher():
+    """Incremental form of content_hash, for files hashed as they are streamed."""
+    return hashlib.sha256()
+
+
+def doc_id_for(user_id: str, digest: str) -> str:
+    """
+    Deterministic doc_id for a user's upload: re-uploading the same PDF
+    overwrites the same vector ids instead of creating a second copy.
+    """
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, f"{user_id}:{digest}"))
@@ -0,0 +1,472 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .pdf_extractor import get_extract_pool, iter_text_by_page
+from .chunker import iter_chunks
+from .embeddings import embed_chunks
+from .vector_db import VectorDB
+from .answer_cache import get_answer_cache
+from .doc_registry import chunk_ids, get_doc_registry
+from .lexical_index import get_lexical_index
+from .metrics import count_chunks, observe_stage
+from .storage import get_storage
+from .upload_spool import SpooledUpload
+
+# Concurrent ingest jobs; everything past this waits in the queue
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+# Finished jobs kept for GET /jobs/{id}
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+# Chunks per embedding request / upsert, and embedding batches in flight per job
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+
+STAGES = ("storage", "extract", "chunk", "embed", "upsert")
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class IngestFile:
+    """One uploaded PDF, spooled to a temp file that is deleted when its job ends."""
+
+    def __init__(self, doc_id: str, filename: str, digest: str, spooled: SpooledUpload):
+        self.doc_id = doc_id
+        self.filename = filename
+        self.digest = digest
+        self.spooled: Optional[SpooledUpload] = spooled
+
+    @property
+    def path(self) -> str:
+        return self.spooled.path
+
+    def release(self) -> None:
+        if self.spooled is not None:
+            self.spooled.remove()
+            self.spooled = None
+
+
+class IngestJob:
+    """One /upload request: every file in it becomes its own document."""
+
+    def __init__(self, user_id: str, category: str, files: List[IngestFile], existing: Optional[List[Dict]] = None):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.category = category
+        self.files = files
+        # Documents in the upload that are already ingested with the same content (result entries)
+        self.existing = existing or []
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.result: Optional[Dict] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stages: Dict[str, Dict] = {name: {"status": "pending", "seconds": None} for name in STAGES}
+        # Vector ids sent to the vector store per doc_id, so a failed job can remove them
+        self.written_ids: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        self.stages[name]["status"] = "running"
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+        self.stages[name]["status"] = "done"
+
+    def add_time(self, name: str, seconds: float) -> None:
+        # Pipelined stages overlap, so their time accumulates across batches
+        with self._lock:
+            info = self.stages[name]
+            if info["status"] != "failed":
+                info["status"] = "running"
+            info["seconds"] = round((info["seconds"] or 0) + seconds, 4)
+
+    def finish_stages(self, status: str, *names: str) -> None:
+        for name, info in self.stages.items():
+            if info["status"] == "running" and (not names or name in names):
+                info["status"] = status
+
+    def mark_failed(self, name: str) -> None:
+        with self._lock:
+            self.stages[name]["status"] = "failed"
+
+    def settle_failed(self) -> None:
+        """
+        After a failure: stages that never started are "skipped", and stages
+        interrupted by another stage's failure are "cancelled". A running
+        stage is only "failed" when nothing recorded which stage failed.
+        """
+        failed = any(info["status"] == "failed" for info in self.stages.values())
+        for info in self.stages.values():
+            if info["status"] == "pending":
+                info["status"] = "skipped"
+            elif info["status"] == "running":
+                info["status"] = "cancelled" if failed else "failed"
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "doc_ids": [f.doc_id for f in self.files] + [d["doc_id"] for d in self.existing],
+            "filenames": [f.filename for f in self.files] + [d["filename"] for d in self.existing],
+            "stages": self.stages,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestQueue:
+    """
+    In-process ingestion queue drained by a fixed pool of worker tasks.
+    Blocking stages run in threads, so the event loop keeps serving
+    other requests while documents are processed.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, maxsize: int = INGEST_QUEUE_SIZE):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._vdb: Optional[VectorDB] = None
+
+    async def start(self, vdb: VectorDB) -> None:
+        if self._queue is not None:
+            return
+        self._vdb = vdb
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def submit(self, job: IngestJob, vdb: VectorDB) -> IngestJob:
+        await self.start(vdb)
+        if not job.files:
+            # Everything in the upload is already ingested: done without queueing
+            job.status = "done"
+            job.started_at = job.finished_at = time.time()
+            job.result = _result(job, {}, 0)
+            for info in job.stages.values():
+                info["status"] = "skipped"
+            self._jobs[job.id] = job
+            self._prune()
+            return job
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"ingest queue is full ({self.maxsize} jobs waiting)")
+        self._jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for j in self._jobs.values() if j.status == "running"),
+        }
+
+    def _prune(self) -> None:
+        while len(self._jobs) > INGEST_JOB_HISTORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await run_ingest(job, self._vdb)
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Ingest job %s failed", job.id)
+                job.settle_failed()
+                job.status = "failed"
+                job.error = str(e)
+                try:
+                    new_docs = await asyncio.to_thread(_discard, job, self._vdb)
+                    for doc_id in new_docs:
+                        await get_storage().delete(job.user_id, doc_id)
+                except Exception:
+                    logger.exception("Cleanup after failed ingest job %s failed", job.id)
+            finally:
+                for f in job.files:
+                    f.release()  # delete the spooled PDF
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+
+async def run_ingest(job: IngestJob, vdb: VectorDB) -> Dict:
+    """
+    The storage upload runs alongside a pipeline: per-file producer threads
+    extract (in the process pool) and chunk, while batches of INGEST_BATCH_SIZE
+    chunks are embedded and upserted as soon as they fill, overlapping with
+    extraction of later pages. The job finishes once both are done.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def store() -> None:
+        try:
+            with job.stage("storage"):
+                await get_storage().upload_many(job.user_id, [(f.doc_id, f.filename, f.path) for f in job.files])
+        except Exception:
+            job.mark_failed("storage")
+            raise
+
+    items: asyncio.Queue = asyncio.Queue(maxsize=4 * INGEST_BATCH_SIZE)
+    abort = threading.Event()
+    storing: Optional[asyncio.Task] = None
+
+    def stop() -> None:
+        # The job is failing: stop the pipeline and any uploads still queued or retrying
+        abort.set()
+        if storing is not None:
+            storing.cancel()
+    counts = {f.doc_id: {"pages": 0, "chunks": 0} for f in job.files}
+
+    def produce(f: IngestFile) -> None:
+        # Pages come back from the extraction processes in order, range by range
+        pages = _Timed(iter_text_by_page(f.path, pool=get_extract_pool()))
+        chunks = _Timed(iter_chunks(pages))
+        try:
+            for chunk in chunks:
+                if abort.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(items.put((f, chunk)), loop).result()
+        except Exception:
+            job.mark_failed("extract" if pages.failed else "chunk")
+            raise
+        counts[f.doc_id] = {"pages": pages.count, "chunks": chunks.count}
+        job.add_time("extract", pages.seconds)
+        job.add_time("chunk", chunks.seconds - pages.seconds)
+
+    async def produce_all() -> None:
+        try:
+            await asyncio.gather(*[asyncio.to_thread(produce, f) for f in job.files])
+            if not abort.is_set():
+                job.finish_stages("done", "extract", "chunk")
+        except Exception:
+            stop()
+            raise
+        finally:
+            await items.put(None)
+
+    slots = asyncio.Semaphore(INGEST_EMBED_CONCURRENCY)
+    cached = [0]
+
+    async def flush(batch) -> None:
+        try:
+            t0 = time.perf_counter()
+            try:
+                embeddings, n_cached = await asyncio.to_thread(embed_chunks, [c["text"] for _, c in batch])
+            except Exception:
+                job.mark_failed("embed")
+                raise
+            finally:
+                job.add_time("embed", time.perf_counter() - t0)
+            cached[0] += n_cached
+            vectors = [_vector(job, f, c, vec) for (f, c), vec in zip(batch, embeddings)]
+            # Recorded before the call: a failed upsert may still have written some of them
+            for v in vectors:
+                job.written_ids.setdefault(v["metadata"]["doc_id"], []).append(v["id"])
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(vdb.upsert, vectors)
+                # BM25 postings for hybrid retrieval, kept in step with the vectors
+                await asyncio.to_thread(get_lexical_index().add, vectors)
+            except Exception:
+                job.mark_failed("upsert")
+                raise
+            finally:
+                job.add_time("upsert", time.perf_counter() - t0)
+        except Exception:
+            stop()
+            raise
+        finally:
+            slots.release()
+
+    async def consume() -> None:
+        tasks = []
+        batch = []
+        while True:
+            item = await items.get()
+            if item is not None and abort.is_set():
+                continue  # drain so producers never block on a full queue
+            if item is not None:
+                batch.append(item)
+            if batch and (item is None or len(batch) >= INGEST_BATCH_SIZE):
+                await slots.acquire()
+                tasks.append(asyncio.create_task(flush(batch)))
+                batch = []
+            if item is None:
+                break
+        # Wait for every flush, not just the first failure, so nothing is written after the job ends
+        _raise_first(await asyncio.gather(*tasks, return_exceptions=True))
+
+    storing = asyncio.create_task(store())
+    # A failed upload fails the job, so stop extracting and embedding right away
+    storing.add_done_callback(lambda t: t.cancelled() or t.exception() is None or abort.set())
+    try:
+        _raise_first(await asyncio.gather(produce_all(), consume(), return_exceptions=True))
+    except BaseException:
+        storing.cancel()
+        raise
+    await storing
+    job.finish_stages("done")
+
+    await asyncio.to_thread(_register, job, vdb, counts)
+    # Cached answers built on an earlier version of these documents are stale
+    for f in job.files:
+        get_answer_cache().invalidate_doc(f.doc_id)
+        count_chunks(counts[f.doc_id]["chunks"])
+    for name, info in job.stages.items():
+        if info["seconds"] is not None:
+            observe_stage(name, info["seconds"])
+
+    return _result(job, counts, cached[0])
+
+
+def _result(job: IngestJob, counts: Dict[str, Dict], cached: int) -> Dict:
+    documents = [
+        {
+            "doc_id": f.doc_id,
+            "filename": f.filename,
+            "content_hash": f.digest,
+            "pages": counts[f.doc_id]["pages"],
+            "chunks_count": counts[f.doc_id]["chunks"],
+        }
+        for f in job.files
+    ] + job.existing
+    return {
+        "documents": documents,
+        "chunks_count": sum(d["chunks_count"] for d in documents),
+        "cached_chunks": cached,
+    }
+
+
+def _raise_first(results: List) -> None:
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def _discard(job: IngestJob, vdb: VectorDB) -> List[str]:
+    """
+    Removes the vectors and BM25 postings a failed job wrote, and returns
+    the doc_ids whose stored PDFs should go too. Documents that were
+    registered before the job keep everything: the ids and object paths are
+    the same, so the registered copy is still what they point to.
+    """
+    registry = get_doc_registry()
+    new_docs = [f.doc_id for f in job.files if registry.get(f.doc_id) is None]
+    for doc_id in new_docs:
+        ids = sorted(set(job.written_ids.get(doc_id, [])))
+        if ids:
+            vdb.delete_ids(ids)
+            get_lexical_index().delete_by_doc(doc_id)
+            logger.info("Removed %d vectors written by failed job %s for %s", len(ids), job.id, doc_id)
+    return new_docs
+
+
+def _register(job: IngestJob, vdb: VectorDB, counts: Dict[str, Dict]) -> None:
+    registry = get_doc_registry()
+    for f in job.files:
+        n_chunks = counts[f.doc_id]["chunks"]
+        previous = registry.record(
+            doc_id=f.doc_id,
+            user_id=job.user_id,
+            category=job.category,
+            filename=f.filename,
+            content_hash=f.digest,
+            pages=counts[f.doc_id]["pages"],
+            chunks_count=n_chunks,
+            timings={name: info["seconds"] for name, info in job.stages.items()},
+        )
+        # A re-ingest that yields fewer chunks leaves the old tail behind; drop it by id
+        if previous and previous["chunks_count"] > n_chunks:
+            stale = chunk_ids(previous, start=n_chunks)
+            vdb.delete_ids(stale)
+            get_lexical_index().delete_ids(stale)
+
+
+def _vector(job: IngestJob, f: IngestFile, c: Dict, vec: List[float]) -> Dict:
+    return {
+        "id": f"{f.doc_id}_chunk_{c['chunk_id']}",
+        "values": vec,
+        "metadata": {
+            "id": f"{f.doc_id}_chunk_{c['chunk_id']}",
+            "doc_id": f.doc_id,
+            "content_hash": f.digest,
+            "user_id": job.user_id,
+            "category": job.category,
+            "page_start": c["page_start"],
+            "page_end": c["page_end"],
+            "chunk_id": c["chunk_id"],
+            "text": c["text"],
+            "source": "user",
+            # Pinecone rejects null metadata values
+            **({"section": c["section"]} if c.get("section") else {}),
+        },
+    }
+
+
+class _Timed:
+    """Iterator wrapper counting items and the time spent producing them."""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.count = 0
+        self.seconds = 0.0
+        self.failed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            item = next(self._it)
+        except StopIteration:
+            raise
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self.seconds += time.perf_counter() - t0
+        self.count += 1
+        return item
+
+
+_queue = IngestQueue()
+
+
+def get_ingest_queue() -> IngestQueue:
+    return _queue
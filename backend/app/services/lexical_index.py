@@ -0,0 +1,259 @@
+import logging
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .doc_registry import DOCS_PAGE_MAX, chunk_ids, get_doc_registry
+from .vector_db import POSTING_KEYS, VectorDB, _match_filter
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Rebuild postings once this fraction of rows are tombstones
+BM25_COMPACT_RATIO = float(os.getenv("BM25_COMPACT_RATIO", "0.25"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have if in into is it its of on or shall "
+    "such that the their there these this to was were will with any all not no".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok in _STOPWORDS or len(tok) < 2:
+            continue
+        # fold simple plurals so "penalties"/"penalty" and "fees"/"fee" meet
+        if tok.endswith("ies") and len(tok) > 4:
+            tok = tok[:-3] + "y"
+        elif tok.endswith("s") and not tok.endswith("ss") and len(tok) > 3:
+            tok = tok[:-1]
+        out.append(tok)
+    return out
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk text. Postings are parallel array('i') row/term-frequency
+    lists per term; deletes tombstone rows and compaction rewrites the postings.
+    Metadata postings (doc_id, category, user_id) restrict searches like
+    the vector index's filters.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._rows: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._df: Counter = Counter()
+        self._ids: List[str] = []
+        self._meta: List[Dict] = []
+        self._lengths = array("i")
+        self._alive = array("b")
+        self._row_of: Dict[str, int] = {}
+        self._meta_postings: Dict[str, Dict[str, List[int]]] = {k: {} for k in POSTING_KEYS}
+        self._live = 0
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def doc_chunks(self, doc_id: str) -> int:
+        """Live chunks indexed for a document."""
+        with self._lock:
+            return sum(1 for r in self._meta_postings["doc_id"].get(doc_id, []) if self._alive[r])
+
+    def stats(self) -> Dict:
+        return {
+            "docs": sum(1 for rows in self._meta_postings["doc_id"].values() if any(self._alive[r] for r in rows)),
+            "chunks": self._live,
+            "tombstones": len(self._ids) - self._live,
+            "terms": len(self._df),
+            "postings": sum(len(rows) for rows in self._rows.values()),
+        }
+
+    def add(self, items: Iterable[Dict]) -> None:
+        """Index items shaped like VectorDB upserts: {"id", "metadata": {"text", ...}}."""
+        with self._lock:
+            for item in items:
+                vid = str(item["id"])
+                meta = dict(item.get("metadata", {}))
+                if vid in self._row_of:
+                    self._tombstone(self._row_of[vid])
+                row = len(self._ids)
+                terms = Counter(tokenize(meta.get("text", "")))
+                for term, tf in terms.items():
+                    self._rows.setdefault(term, array("i")).append(row)
+                    self._tfs.setdefault(term, array("i")).append(tf)
+                    self._df[term] += 1
+                length = sum(terms.values())
+                self._ids.append(vid)
+                self._meta.append(meta)
+                self._lengths.append(length)
+                self._alive.append(1)
+                self._row_of[vid] = row
+                for key, postings in self._meta_postings.items():
+                    value = meta.get(key)
+                    if isinstance(value, str):
+                        postings.setdefault(value, []).append(row)
+                self._live += 1
+                self._total_len += length
+            self._maybe_compact()
+
+    def delete_by_doc(self, doc_id: str) -> int:
+        with self._lock:
+            rows = [r for r in self._meta_postings["doc_id"].get(doc_id, []) if self._alive[r]]
+            for row in rows:
+                self._tombstone(row)
+            self._maybe_compact()
+            return len(rows)
+
+    def delete_ids(self, ids: Iterable[str]) -> int:
+        with self._lock:
+            rows = [self._row_of[i] for i in ids if i in self._row_of]
+            for row in rows:
+                self._tombstone(row)
+            self._maybe_compact()
+            return len(rows)
+
+    def search(self, query: str, top_k: int = 20, filters: Optional[List[Optional[Dict]]] = None) -> List[Dict]:
+        """Top-k rows by BM25 among rows matching any of the filters."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_rows = len(self._ids)
+            if not terms or not self._live or top_k <= 0:
+                return []
+            mask = self._filter_mask(filters, n_rows)
+            if mask is not None and not mask.any():
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.int32).astype(np.float32)
+            avgdl = self._total_len / self._live or 1.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+            scores = np.zeros(n_rows, dtype=np.float32)
+            for term in terms:
+                df = self._df.get(term, 0)
+                if not df:
+                    continue
+                idf = np.log(1 + (self._live - df + 0.5) / (df + 0.5))
+                rows = np.frombuffer(self._rows[term], dtype=np.int32)
+                tf = np.frombuffer(self._tfs[term], dtype=np.int32).astype(np.float32)
+                scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+            scores *= np.frombuffer(self._alive, dtype=np.int8)
+            if mask is not None:
+                scores *= mask
+            hits = np.flatnonzero(scores > 0)
+            if hits.size == 0:
+                return []
+            k = min(top_k, hits.size)
+            best = hits[np.argpartition(-scores[hits], k - 1)[:k]] if k < hits.size else hits
+            best = best[np.argsort(-scores[best], kind="stable")]
+            return [
+                {"id": self._ids[r], "score": float(scores[r]), "metadata": dict(self._meta[r])}
+                for r in best
+            ]
+
+    def _filter_mask(self, filters: Optional[List[Optional[Dict]]], n_rows: int) -> Optional[np.ndarray]:
+        if not filters or any(not f for f in filters):
+            return None
+        mask = np.zeros(n_rows, dtype=np.float32)
+        for flt in filters:
+            indexed = [(k, v) for k, v in flt.items() if k in self._meta_postings and isinstance(v, str)]
+            rest = {k: v for k, v in flt.items() if (k, v) not in indexed}
+            if indexed:
+                postings = sorted((self._meta_postings[k].get(v, []) for k, v in indexed), key=len)
+                rows = set(postings[0]).intersection(*postings[1:])
+            else:
+                rows = range(n_rows)
+            if rest:
+                rows = [r for r in rows if _match_filter(self._meta[r], rest)]
+            mask[list(rows)] = 1.0
+        return mask
+
+    def _tombstone(self, row: int) -> None:
+        if not self._alive[row]:
+            return
+        self._alive[row] = 0
+        for term in set(tokenize(self._meta[row].get("text", ""))):
+            self._df[term] -= 1
+            if self._df[term] <= 0:
+                del self._df[term]
+        del self._row_of[self._ids[row]]
+        self._live -= 1
+        self._total_len -= self._lengths[row]
+
+    def _maybe_compact(self) -> None:
+        if self._ids and (len(self._ids) - self._live) / len(self._ids) > BM25_COMPACT_RATIO:
+            self._compact()
+
+    def _compact(self) -> None:
+        live = [(self._ids[r], self._meta[r]) for r in range(len(self._ids)) if self._alive[r]]
+        self._reset()
+        self.add({"id": vid, "metadata": meta} for vid, meta in live)
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[List[Dict]], top_k: int, k: int = RRF_K) -> List[Dict]:
+    """
+    Fuse ranked match lists by summing 1 / (k + rank). Each fused match keeps the
+    first list's metadata and records its per-list scores under "scores".
+    """
+    fused: Dict[str, Dict] = {}
+    for list_no, matches in enumerate(ranked_lists):
+        for rank, m in enumerate(matches):
+            entry = fused.setdefault(m["id"], {"id": m["id"], "rrf": 0.0, "scores": {}, "metadata": m.get("metadata", {})})
+            entry["rrf"] += 1.0 / (k + rank + 1)
+            entry["scores"][list_no] = m.get("score")
+    return sorted(fused.values(), key=lambda e: e["rrf"], reverse=True)[:top_k]
+
+
+def sync_docs(doc_ids: Iterable[str], vdb: VectorDB) -> int:
+    """
+    Loads registered documents the index is missing (or holds only part of)
+    from the chunk text stored with their vectors. The index lives in process
+    memory and ingest only feeds the worker that ran it, so this covers
+    documents from before a restart or from other uvicorn workers. Blocking;
+    returns the number of documents loaded.
+    """
+    registry = get_doc_registry()
+    loaded = 0
+    for doc_id in doc_ids:
+        doc = registry.get(doc_id)
+        if doc is None or _index.doc_chunks(doc_id) == doc["chunks_count"]:
+            continue
+        ids = chunk_ids(doc)
+        meta = vdb.fetch_metadata(ids)
+        _index.delete_by_doc(doc_id)
+        _index.add({"id": vid, "metadata": meta[vid]} for vid in ids if vid in meta)
+        loaded += 1
+        if len(meta) < len(ids):
+            logger.warning("Lexical index: %d of %d chunks of %s have no stored text", len(ids) - len(meta), len(ids), doc_id)
+    return loaded
+
+
+def rebuild_from_registry(vdb: VectorDB) -> int:
+    """sync_docs over every registered document, page by page (startup warm-up)."""
+    registry = get_doc_registry()
+    loaded, offset, total = 0, 0, 0
+    while offset is not None:
+        page = registry.list(limit=DOCS_PAGE_MAX, offset=offset)
+        loaded += sync_docs((d["doc_id"] for d in page["docs"]), vdb)
+        offset, total = page["next_offset"], page["total"]
+    logger.info("Lexical index covers %d of %d registered documents (%d loaded from the vector store)",
+                _index.stats()["docs"], total, loaded)
+    return loaded
+
+
+_index = BM25Index()
+
+
+def get_lexical_index() -> BM25Index:
+    return _index
@@ -1,24 +1,55 @@
+import logging
 import os
+from typing import AsyncIterator
 from dotenv import load_dotenv
 load_dotenv()
 
-from google import genai
-from google.genai import types
+from .providers import get_gemini_client
 
+logger = logging.getLogger(__name__)
 
-client = genai.Client()
+LLM_MODEL = "gemini-2.0-flash"
+MOCK_ANSWER = "[Local mock] Unable to call Gemini. Provide mock answer."
 
 
 def generate_answer(system_prompt: str) -> str:
+    client = get_gemini_client()
+    if client is None:
+        return MOCK_ANSWER
     try:
         resp = client.models.generate_content(
-            model="gemini-2.0-flash", 
+            model=LLM_MODEL, 
             contents=system_prompt, 
         )
-        print(resp.text)
+        logger.debug("Gemini answer: %d chars", len(resp.text or ""))
         return resp.text
     except Exception as e:
-        print(f"Error generating answer: {e}")
-        return "[Local mock] Unable to call Gemini. Provide mock answer."
+        logger.warning("Error generating answer: %s", e)
+        return MOCK_ANSWER
 
 
+async def stream_answer(system_prompt: str) -> AsyncIterator[str]:
+    """
+    Yields answer text as Gemini produces it. Closing the generator (e.g. when
+    the client disconnects) closes the underlying stream, so generation stops.
+    """
+    client = get_gemini_client()
+    if client is None:
+        yield MOCK_ANSWER
+        return
+    started = False
+    try:
+        stream = await client.aio.models.generate_content_stream(
+            model=LLM_MODEL,
+            contents=system_prompt,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                started = True
+                yield chunk.text
+    except Exception as e:
+        # Mid-answer failures must surface; before any text, match generate_answer
+        if started:
+            raise
+        logger.warning("Error streaming answer: %s", e)
+        yield MOCK_ANSWER
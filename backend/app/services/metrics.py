@@ -0,0 +1,89 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+# Set (to an empty, writable directory) when running several uvicorn workers so
+# /metrics aggregates every process; see prometheus_client's multiprocess mode
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Pipeline stages timed per request / per ingested document
+STAGES = ("storage", "extract", "chunk", "embed", "upsert", "retrieve", "prompt_build", "llm", "export")
+
+# 5 ms .. 2 min: covers a cached retrieve as well as a large document's embed stage
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "legallens_stage_seconds", "Time spent in one pipeline stage", ["stage"], buckets=_BUCKETS
+)
+HTTP_SECONDS = Histogram(
+    "legallens_http_request_seconds", "HTTP request latency by route", ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "legallens_cache_lookups_total", "Cache lookups by cache and result (hit, disk_hit, miss)", ["cache", "result"]
+)
+CHUNKS = Counter("legallens_chunks_total", "Chunks ingested", ["source"])
+DOCUMENT_CHUNKS = Histogram(
+    "legallens_document_chunks", "Chunks per ingested document",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+VECTOR_BACKEND = Gauge(
+    "legallens_vector_backend", "Vector store backend in use (1 for the active one)", ["backend"],
+    multiprocess_mode="max",
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def count_cache(cache: str, result: str) -> None:
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def count_chunks(n: int, source: str = "user") -> None:
+    CHUNKS.labels(source).inc(n)
+    DOCUMENT_CHUNKS.observe(n)
+
+
+def set_vector_backend(backend: str) -> None:
+    for name in ("pinecone", "mmap", "memory"):
+        VECTOR_BACKEND.labels(name).set(1 if name == backend else 0)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Exposition body and content type for GET /metrics."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+async def http_metrics_middleware(request, call_next):
+    """Time every request under its route template, so /jobs/{job_id} is one series."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        if path != "/metrics":
+            HTTP_SECONDS.labels(request.method, path, str(status)).observe(time.perf_counter() - t0)
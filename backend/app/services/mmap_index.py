@@ -0,0 +1,376 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .ann_index import ANN_MIN_ROWS, ann_search, make_ann
+from .vector_db import POSTING_KEYS, _hashable, _match_filter
+
+VECTOR_STORE_DIR = os.getenv(
+    "VECTOR_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "vectors")
+)
+# Compact once this fraction of rows are tombstones (and there are enough of them)
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.3"))
+VECTOR_COMPACT_MIN_ROWS = int(os.getenv("VECTOR_COMPACT_MIN_ROWS", "1024"))
+
+# SQLite caps bound parameters per statement
+_SQL_BATCH = 500
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rows (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    {", ".join(f"{k} TEXT" for k in POSTING_KEYS)},
+    metadata TEXT NOT NULL,
+    deleted INTEGER
+);
+CREATE INDEX IF NOT EXISTS rows_live_id_idx ON rows (id) WHERE deleted IS NULL;
+CREATE INDEX IF NOT EXISTS rows_live_doc_idx ON rows (doc_id) WHERE deleted IS NULL;
+CREATE INDEX IF NOT EXISTS rows_deleted_idx ON rows (deleted);
+"""
+
+
+class MmapIndex:
+    """
+    Persistent cosine index: L2-normalised float32 rows in a flat file that
+    every process memory-maps read-only, with ids and metadata in a SQLite
+    sidecar. Upserts append rows and tombstone the ones they replace; deletes
+    only tombstone. Compaction rewrites the live rows into a new file
+    generation. Each write bumps a version in the sidecar, and readers catch
+    up on the rows and tombstones added since the version they last saw, so
+    several uvicorn workers share one index and a restart serves at once.
+    """
+
+    def __init__(self, directory: str = VECTOR_STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self._dir = directory
+        self._db = sqlite3.connect(
+            os.path.join(directory, "meta.sqlite"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._version = -1
+        self._generation = -1
+        self._rows = 0
+        self._dim: Optional[int] = None
+        self._mm: Optional[np.memmap] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._postings: Dict[str, Dict[str, set]] = {k: {} for k in POSTING_KEYS}
+        self._after_commit = None
+        self._ann = make_ann()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            live = int(self._alive.sum())
+            return {
+                "rows": self._rows,
+                "live": live,
+                "tombstones": self._rows - live,
+                "generation": self._generation,
+                "bytes": self._rows * (self._dim or 0) * 4,
+                "ann": self._ann.stats() if self._ann is not None else None,
+            }
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        if not vectors:
+            return
+        # Last write wins for ids repeated within one batch
+        latest = {str(v["id"]): v for v in vectors}
+        vectors = list(latest.values())
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.ndim != 2:
+            raise ValueError("vectors must all have the same dimension")
+        values /= np.linalg.norm(values, axis=1, keepdims=True) + 1e-9
+        with self._lock, self._write() as info:
+            dim = int(info.get("dim", values.shape[1]))
+            if dim != values.shape[1]:
+                raise ValueError(f"vector dimension {values.shape[1]} != index dimension {dim}")
+            version, rows, gen = info["version"] + 1, info["rows"], info["generation"]
+            self._tombstone_where("id", list(latest), version)
+            # Rows past info.rows are leftovers of a write that never committed
+            fd = os.open(self._path(gen), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.pwrite(fd, values.tobytes(), rows * dim * 4)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._db.executemany(
+                f"INSERT INTO rows (row, id, {', '.join(POSTING_KEYS)}, metadata) "
+                f"VALUES ({', '.join('?' * (len(POSTING_KEYS) + 3))})",
+                [
+                    (rows + i, vid, *(_key(v.get("metadata", {}), k) for k in POSTING_KEYS),
+                     json.dumps(v.get("metadata", {})))
+                    for i, (vid, v) in enumerate(latest.items())
+                ],
+            )
+            self._set_info(dim=dim, rows=rows + len(vectors), version=version)
+            self._maybe_compact({**info, "dim": dim, "rows": rows + len(vectors), "version": version})
+        with self._lock:
+            self._refresh()
+
+    def delete_ids(self, ids: List[str]) -> int:
+        return self._delete("id", list(ids))
+
+    def delete_by_doc(self, doc_id: str) -> int:
+        return self._delete("doc_id", [doc_id])
+
+    def metadata(self, ids: List[str]) -> Dict[str, Dict]:
+        out = {}
+        for start in range(0, len(ids), _SQL_BATCH):
+            part = ids[start:start + _SQL_BATCH]
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT id, metadata FROM rows WHERE deleted IS NULL AND id IN ({', '.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+            out.update((vid, json.loads(meta)) for vid, meta in rows)
+        return out
+
+    def query(self, vector: List[float], top_k: int = 5, filter: Optional[Dict] = None) -> List[Dict]:
+        return self.query_many(vector, [filter], top_k=top_k)
+
+    def query_many(self, vector: List[float], filters: List[Optional[Dict]], top_k: int = 5) -> List[Dict]:
+        """Top-k over live rows matching any of the filters (their union)."""
+        if top_k <= 0 or not filters:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-9)
+        with self._lock:
+            # One read transaction: rows, tombstones and metadata all come from the same snapshot
+            self._db.execute("BEGIN")
+            try:
+                self._refresh()
+                if self._mm is None or not self._alive.any():
+                    return []
+                if q.shape[0] != self._dim:
+                    raise ValueError(f"query dimension {q.shape[0]} != index dimension {self._dim}")
+                selected = [self._select(f) for f in filters]
+                if any(rows is None for rows in selected):
+                    rows = None
+                else:
+                    rows = np.unique(np.concatenate(selected)) if len(selected) > 1 else selected[0]
+                    if rows.size == 0:
+                        return []
+                hit = ann_search(self._ann, q, self._mm, rows, top_k, alive=self._alive)
+                if hit is not None:
+                    rows, scores = hit
+                    best = range(rows.size)
+                else:
+                    if rows is None:
+                        rows = np.flatnonzero(self._alive)
+                        scores = (self._mm @ q)[rows]
+                    else:
+                        scores = self._mm[rows] @ q
+                    k = min(top_k, scores.shape[0])
+                    best = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(k)
+                    best = best[np.argsort(-scores[best], kind="stable")]
+                found = self._fetch(int(rows[i]) for i in best)
+                return [
+                    {"id": found[int(rows[i])][0], "score": float(scores[i]), "metadata": found[int(rows[i])][1]}
+                    for i in best
+                ]
+            finally:
+                self._db.execute("COMMIT")
+
+    def compact(self) -> None:
+        """Rewrite live rows into a new file generation and renumber them."""
+        with self._lock, self._write() as info:
+            self._compact(info)
+        with self._lock:
+            self._refresh()
+
+    def _delete(self, column: str, values: List[str]) -> int:
+        if not values:
+            return 0
+        with self._lock, self._write() as info:
+            version = info["version"] + 1
+            removed = self._tombstone_where(column, values, version)
+            if not removed:
+                return 0
+            self._set_info(version=version)
+            self._maybe_compact({**info, "version": version})
+        with self._lock:
+            self._refresh()
+        return removed
+
+    def _maybe_compact(self, info: Dict) -> None:
+        dead = self._db.execute("SELECT COUNT(*) FROM rows WHERE deleted IS NOT NULL").fetchone()[0]
+        if dead >= VECTOR_COMPACT_MIN_ROWS and dead > VECTOR_COMPACT_RATIO * info["rows"]:
+            self._compact(info)
+
+    def _compact(self, info: Dict) -> None:
+        live = [r for (r,) in self._db.execute("SELECT row FROM rows WHERE deleted IS NULL ORDER BY row")]
+        gen, dim = info["generation"] + 1, int(info.get("dim") or 0)
+        old_path = self._path(info["generation"])
+        if live and dim:
+            src = np.memmap(old_path, dtype=np.float32, mode="r", shape=(info["rows"], dim))
+            dst = np.memmap(self._path(gen), dtype=np.float32, mode="w+", shape=(len(live), dim))
+            for start in range(0, len(live), 65536):
+                block = live[start:start + 65536]
+                dst[start:start + len(block)] = src[block]
+            dst.flush()
+            del src, dst
+        self._db.execute("DELETE FROM rows WHERE deleted IS NOT NULL")
+        # New numbers never exceed old ones, so renumbering in ascending order never collides
+        self._db.executemany("UPDATE rows SET row = ? WHERE row = ?", [(new, old) for new, old in enumerate(live)])
+        self._set_info(rows=len(live), generation=gen, version=info["version"] + 1)
+        # Readers still mapping the old file keep their pages until they refresh
+        self._after_commit = lambda: os.path.exists(old_path) and os.unlink(old_path)
+
+    def _tombstone_where(self, column: str, values: List[str], version: int) -> int:
+        removed = 0
+        for start in range(0, len(values), _SQL_BATCH):
+            part = values[start:start + _SQL_BATCH]
+            cur = self._db.execute(
+                f"UPDATE rows SET deleted = ? WHERE deleted IS NULL AND {column} IN ({', '.join('?' * len(part))})",
+                (version, *part),
+            )
+            removed += cur.rowcount
+        return removed
+
+    def _write(self):
+        return _WriteTxn(self)
+
+    def _info(self) -> Dict:
+        info = {k: v for k, v in self._db.execute("SELECT key, value FROM info")}
+        out = {"version": int(info.get("version", 0)), "rows": int(info.get("rows", 0)),
+               "generation": int(info.get("generation", 0))}
+        if "dim" in info:
+            out["dim"] = int(info["dim"])
+        return out
+
+    def _set_info(self, **values) -> None:
+        self._db.executemany(
+            "INSERT INTO info (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            [(k, str(v)) for k, v in values.items()],
+        )
+
+    def _refresh(self) -> None:
+        """Catch up with writes (from any process) since the last version seen."""
+        info = self._info()
+        if info["version"] == self._version:
+            return
+        if info["generation"] != self._generation:
+            self._rows = 0
+            self._alive = np.zeros(0, dtype=bool)
+            self._postings = {k: {} for k in POSTING_KEYS}
+            self._version = -1
+            self._generation = info["generation"]
+            if self._ann is not None:
+                self._ann.reset_rows()  # rows were renumbered; the quantizer still applies
+        cols = ", ".join(POSTING_KEYS)
+        old_rows = self._rows
+        added = self._db.execute(
+            f"SELECT row, deleted, {cols} FROM rows WHERE row >= ? AND row < ? ORDER BY row",
+            (old_rows, info["rows"]),
+        ).fetchall()
+        alive = np.zeros(info["rows"], dtype=bool)
+        alive[:old_rows] = self._alive[:old_rows]
+        for row, deleted, *keys in added:
+            if deleted is None:
+                alive[row] = True
+                self._index(row, keys)
+        if old_rows:
+            for row, *keys in self._db.execute(
+                f"SELECT row, {cols} FROM rows WHERE deleted > ? AND row < ?", (self._version, old_rows)
+            ):
+                if alive[row]:
+                    alive[row] = False
+                    self._unindex(row, keys)
+        self._alive = alive
+        self._rows = info["rows"]
+        self._dim = info.get("dim")
+        self._version = info["version"]
+        self._mm = (
+            np.memmap(self._path(self._generation), dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+            if self._rows and self._dim else None
+        )
+        if self._ann is not None and self._mm is not None:
+            if self._ann.trained and self._rows > old_rows:
+                self._ann.set_rows(np.arange(old_rows, self._rows), np.asarray(self._mm[old_rows:]))
+            self._ann.resize(self._rows)
+            if (not self._ann.trained or self._ann.pending()) and self._alive.sum() >= ANN_MIN_ROWS:
+                self._ann.build_async(self._lock, lambda: self._mm)
+
+    def _select(self, flt: Optional[Dict]) -> Optional[np.ndarray]:
+        """Live row indices matching the filter, or None when every live row matches."""
+        if not flt:
+            return None
+        indexed = [(k, v) for k, v in flt.items() if k in self._postings and isinstance(v, str)]
+        rest = {k: v for k, v in flt.items() if (k, v) not in indexed}
+        if indexed:
+            postings = sorted((self._postings[k].get(v, set()) for k, v in indexed), key=len)
+            candidates = sorted(set(postings[0]).intersection(*postings[1:]))
+        else:
+            candidates = np.flatnonzero(self._alive).tolist()
+        if rest:
+            meta = self._fetch(candidates)
+            candidates = [r for r in candidates if _match_filter(meta[r][1], rest)]
+        return np.asarray(candidates, dtype=np.int64)
+
+    def _fetch(self, rows: Iterable[int]) -> Dict[int, tuple]:
+        rows = list(rows)
+        out = {}
+        for start in range(0, len(rows), _SQL_BATCH):
+            part = rows[start:start + _SQL_BATCH]
+            for row, vid, meta in self._db.execute(
+                f"SELECT row, id, metadata FROM rows WHERE row IN ({', '.join('?' * len(part))})", part
+            ):
+                out[row] = (vid, json.loads(meta))
+        return out
+
+    def _index(self, row: int, keys: List[Optional[str]]) -> None:
+        for key, value in zip(POSTING_KEYS, keys):
+            if value is not None:
+                self._postings[key].setdefault(value, set()).add(row)
+
+    def _unindex(self, row: int, keys: List[Optional[str]]) -> None:
+        for key, value in zip(POSTING_KEYS, keys):
+            rows = self._postings[key].get(value)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._postings[key][value]
+
+    def _path(self, generation: int) -> str:
+        return os.path.join(self._dir, f"vectors-{generation}.f32")
+
+
+class _WriteTxn:
+    """BEGIN IMMEDIATE ... COMMIT: one writer at a time across processes."""
+
+    def __init__(self, index: MmapIndex):
+        self._index = index
+
+    def __enter__(self) -> Dict:
+        self._index._after_commit = None
+        self._index._db.execute("BEGIN IMMEDIATE")
+        return self._index._info()
+
+    def __exit__(self, exc_type, exc, tb):
+        db = self._index._db
+        if exc_type is not None:
+            db.execute("ROLLBACK")
+            return False
+        db.execute("COMMIT")
+        if self._index._after_commit:
+            self._index._after_commit()
+        return False
+
+
+def _key(meta: Dict, key: str) -> Optional[str]:
+    value = meta.get(key)
+    return str(value) if value is not None and _hashable(value) else None
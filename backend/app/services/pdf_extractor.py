@@ -1,20 +1,135 @@
-from typing import List, Tuple
-import fitz  # PyMuPDF
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
+
+# Worker processes for extraction; PyMuPDF holds the GIL, so threads don't help
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Documents with at least this many pages are split into page ranges across workers
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "48"))
+# Page-range tasks in flight per document
+PDF_PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", str(PDF_EXTRACT_PROCESSES)))
+# Workers open the PDF from here instead of receiving pickled bytes; /dev/shm keeps it in RAM
+PDF_SPOOL_DIR = os.getenv(
+    "PDF_SPOOL_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
 
 
 def extract_text_by_page(pdf_bytes: bytes) -> List[Tuple[int, str]]:
     """
     Returns list of (page_number starting at 1, text)
     """
-    texts: List[Tuple[int, str]] = []
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+    return list(iter_text_by_page(pdf_bytes))
+
+
+def iter_text_by_page(
+    pdf: Union[bytes, str], pool: Optional[ProcessPoolExecutor] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number starting at 1, text) one page at a time, so callers
+    can start chunking and embedding before the whole document is read.
+    `pdf` is the file's bytes or a path to it; a path is opened in place
+    (by every worker, with a pool) so the document is never held in memory.
+    With a pool, pages are extracted in worker processes (page ranges in
+    parallel for large documents) and still yielded in page order.
+    """
+    if pool is not None:
+        yield from _iter_parallel(pdf, pool)
+        return
+    import fitz  # PyMuPDF; imported on first use to keep it off the startup path
+
+    opened = fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")
+    with opened as doc:
         for i, page in enumerate(doc):
             text = page.get_text("text") or ""
-            texts.append((i + 1, _clean_text(text)))
-    return texts
+            yield i + 1, _clean_text(text)
 
 
-def _clean_text(text: str) -> str:
-    return "\n".join([line.strip() for line in text.splitlines() if line.strip()])
+def _iter_parallel(pdf: Union[bytes, str], pool: ProcessPoolExecutor) -> Iterator[Tuple[int, str]]:
+    import fitz
+
+    spooled = not isinstance(pdf, str)
+    if spooled:
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=PDF_SPOOL_DIR)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(pdf)
+    else:
+        path = pdf
+    pending = deque()
+    try:
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+        if page_count < PDF_PARALLEL_MIN_PAGES:
+            ranges = [(0, page_count)]
+        else:
+            # A few ranges per worker keeps them busy and pages flowing in order
+            step = max(8, -(-page_count // (PDF_PARALLEL_WORKERS * 4)))
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+        todo = iter(ranges)
+        for start, stop in todo:
+            pending.append(pool.submit(_extract_range, path, start, stop))
+            if len(pending) >= PDF_PARALLEL_WORKERS:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append(pool.submit(_extract_range, path, *nxt))
+            yield from pages
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if spooled:
+            os.unlink(path)
+
 
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    import fitz
 
+    with fitz.open(path) as doc:
+        return [
+            (i + 1, _clean_text(doc[i].get_text("text") or ""))
+            for i in range(start, stop)
+        ]
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    global _pool
+    # Ingest workers call this from their own threads; only one of them may create the pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent has live threads (event loop, HTTP pools)
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _warm_worker() -> None:
+    import fitz  # noqa: F401
+
+
+def warm_extract_pool() -> None:
+    """Start every extraction worker and load PyMuPDF in it, ahead of the first upload."""
+    pool = get_extract_pool()
+    for fut in [pool.submit(_warm_worker) for _ in range(PDF_EXTRACT_PROCESSES)]:
+        fut.result()
+
+
+def shutdown_extract_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def _clean_text(text: str) -> str:
+    return "\n".join([line.strip() for line in text.splitlines() if line.strip()])
@@ -0,0 +1,137 @@
+import os
+import re
+from typing import Dict, List, Set
+
+from .chunker import estimate_tokens
+from .lexical_index import tokenize
+
+# Whole-prompt budget in estimated tokens (instructions + question + context)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2500"))
+# Most tokens any single chunk may contribute after sentence trimming
+PROMPT_CHUNK_TOKENS = int(os.getenv("PROMPT_CHUNK_TOKENS", "350"))
+
+# Sentence ends, clause separators and line breaks; legal text rarely uses "!" or "?"
+_SENTENCE_RE = re.compile(r"(?<=[.;:?!])\s+(?=[A-Z0-9(\"'])|\n+")
+
+_SYSTEM = (
+    "SYSTEM: You are LegalLens, an assistant that analyzes legal agreements. "
+    "Summarize what the uploaded contract says about repayment, interest, penalties, and obligations. "
+    "Highlight risks and burdens for the borrower in simple language. "
+    "If the document lacks details, say that clearly. "
+    "You may state whether the terms seem strict, flexible, risky, or favorable, but DO NOT directly tell the user "
+    "to take or not take the loan. "
+    "Use subheadings for each section in **bold** format (for example: **Repayment:**, **Interest:**, **Penalties:**, **Obligations:**, **Action steps:**). "
+)
+_TASK = (
+    "\n\nTASK:\n1) Answer the user's question concisely in plain English.\n"
+    "2) If the user document lacks direct info, use category context and explicitly say 'Using category precedents:'.\n"
+    "3) Provide a short 'Action steps:' section (2-4 bullet points) with the heading in **bold**.\n"
+    "4) Output must be plain text only — no markdown formatting except for the bold subheadings.\n\nEND."
+)
+
+
+class BuiltPrompt:
+    def __init__(self, text: str, prompt_tokens: int, used: List[Dict], dropped: int, trimmed: int):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.used = used          # chunks that made it into the prompt, with trimmed text
+        self.dropped = dropped    # chunks left out by dedup or the budget
+        self.trimmed = trimmed    # chunks that lost sentences
+
+    def stats(self) -> Dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "chunks_used": len(self.used),
+            "chunks_dropped": self.dropped,
+            "chunks_trimmed": self.trimmed,
+        }
+
+
+def build_prompt(question: str, category: str, user_chunks: List[Dict], category_chunks: List[Dict],
+                 budget: int = PROMPT_TOKEN_BUDGET, chunk_tokens: int = PROMPT_CHUNK_TOKENS) -> BuiltPrompt:
+    """
+    Assemble the /ask prompt within `budget` estimated tokens. Chunks are taken
+    in rank order (user chunks first); each is cut to its sentences that best
+    match the question, sentences already used by a higher-ranked chunk are
+    skipped, and chunks stop being added once the budget is spent.
+    """
+    fixed = _SYSTEM + f"USER QUESTION:\n{question}\n\n" + _TASK
+    remaining = budget - estimate_tokens(fixed) - 2 * estimate_tokens("(none)") - 20  # section headers
+    query_terms = set(tokenize(question))
+    seen: Set[str] = set()
+    used: List[Dict] = []
+    dropped = trimmed = 0
+
+    for m in user_chunks + category_chunks:
+        header = _header(m, category)
+        # +1 per piece: estimate_tokens rounds down, so sums undercount the joined text
+        room = min(chunk_tokens, remaining - estimate_tokens(header) - 2)
+        text, was_trimmed = _compress(m.get("text", ""), query_terms, seen, room) if room > 0 else ("", False)
+        if not text:
+            dropped += 1
+            continue
+        trimmed += was_trimmed
+        used.append({**m, "text": text})
+        remaining -= estimate_tokens(header) + estimate_tokens(text) + 2
+
+    user = [m for m in used if m.get("source") != "category"]
+    cat = [m for m in used if m.get("source") == "category"]
+    text = (
+        _SYSTEM
+        + f"USER QUESTION:\n{question}\n\n"
+        + "USER DOCUMENT CHUNKS (highest relevance first):\n"
+        + ("\n\n".join(f"{i}) {_header(m, category)}\n{m['text']}" for i, m in enumerate(user, 1)) or "(none)")
+        + "\n\nCATEGORY CONTEXT (optional, supporting only if user chunks insufficient):\n"
+        + ("\n\n".join(f"{i}) {_header(m, category)}\n{m['text']}" for i, m in enumerate(cat, 1)) or "(none)")
+        + _TASK
+    )
+    return BuiltPrompt(text, estimate_tokens(text), used, dropped, trimmed)
+
+
+def _header(m: Dict, category: str) -> str:
+    if m.get("source") == "category":
+        return f"[CATEGORY:{category} | SRC:{m.get('doc_id', 'cat')} | CHUNK:{m.get('chunk_id', '-')}]"
+    return (
+        f"[DOC:{m.get('doc_id')} | CHUNK:{m.get('chunk_id')} | "
+        f"PAGES:{m.get('page_start', '-')}-{m.get('page_end', '-')} | SIM:{m.get('similarity', 0):.2f}]"
+    )
+
+
+def _compress(text: str, query_terms: Set[str], seen: Set[str], max_tokens: int):
+    """
+    Keep the chunk's most query-relevant new sentences that fit in max_tokens,
+    in their original order, and add them to `seen`. Returns (text, trimmed).
+    """
+    sentences, keys = [], []
+    trimmed = False
+    for s in _SENTENCE_RE.split(text):
+        s = s.strip()
+        if not s:
+            continue
+        key = " ".join(s.lower().split())
+        if key in seen or key in keys:
+            trimmed = True  # overlap with a higher-ranked chunk, or repeated boilerplate
+            continue
+        sentences.append(s)
+        keys.append(key)
+
+    keep = list(range(len(sentences)))
+    if sum(estimate_tokens(s) + 1 for s in sentences) > max_tokens:
+        def relevance(i: int) -> float:
+            terms = tokenize(sentences[i])
+            if not terms:
+                return 0.0
+            hits = sum(1 for t in terms if t in query_terms)
+            # distinct matches dominate; density breaks ties between long and short sentences
+            return len(query_terms.intersection(terms)) + hits / len(terms)
+
+        keep, room = [], max_tokens
+        for i in sorted(range(len(sentences)), key=lambda i: (-relevance(i), i)):
+            cost = estimate_tokens(sentences[i]) + 1
+            if cost <= room:
+                keep.append(i)
+                room -= cost
+        keep.sort()
+        trimmed = True
+    seen.update(keys[i] for i in keep)
+    return " ".join(sentences[i] for i in keep), trimmed
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "background": warm clients and pools after startup without delaying readiness;
+# "blocking": finish warming before serving; "off": create everything on first use
+STARTUP_WARM = os.getenv("STARTUP_WARM", "background")
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupReport:
+    """Wall time of each import, client creation and warm-up step, in order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_after: Optional[float] = None
+        self._steps: List[Dict] = []
+        self._warnings: List[str] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - t0, ok)
+
+    def record(self, name: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self._steps.append({"step": name, "ms": round(seconds * 1000, 1), "ok": ok})
+
+    def warn(self, message: str) -> None:
+        """A degraded setup worth surfacing; logged and listed under /health "startup"."""
+        logger.warning(message)
+        with self._lock:
+            self._warnings.append(message)
+
+    def mark_ready(self) -> None:
+        self.ready_after = time.perf_counter() - self.started
+        logger.info(
+            "Ready after %.0f ms: %s", self.ready_after * 1000,
+            ", ".join(f"{s['step']} {s['ms']:.0f} ms" for s in self.steps()),
+        )
+
+    def steps(self) -> List[Dict]:
+        with self._lock:
+            return list(self._steps)
+
+    def to_dict(self) -> Dict:
+        return {
+            "ready_after_ms": round(self.ready_after * 1000, 1) if self.ready_after is not None else None,
+            "steps": self.steps(),
+            "warnings": list(self._warnings),
+        }
+
+
+startup_report = StartupReport()
+
+
+class Provider(Generic[T]):
+    """
+    A service client built on first use (or by warm()) and cached for the
+    process. Creation is timed into the startup report. A failed creation is
+    not cached, so the next use retries; set() swaps in another instance
+    (a fake in benchmarks).
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if self._ready:
+            return self._value  # type: ignore[return-value]
+        with self._lock:
+            if not self._ready:
+                with startup_report.phase(f"init:{self.name}"):
+                    self._value = self._factory()
+                self._ready = True
+        return self._value  # type: ignore[return-value]
+
+    def warm(self) -> None:
+        try:
+            self.get()
+        except Exception as e:
+            logger.warning("Warming %s failed: %s", self.name, e)
+
+    def set(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._ready = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+
+def _vertex_configured() -> bool:
+    """Vertex AI with application default credentials, e.g. the Cloud Run service account."""
+    return os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "").lower() in ("1", "true") \
+        and bool(os.getenv("GOOGLE_CLOUD_PROJECT"))
+
+
+def _gemini_client():
+    """
+    google-genai client, through Vertex AI when GOOGLE_GENAI_USE_VERTEXAI and
+    GOOGLE_CLOUD_PROJECT are set, else with an API key. None without either
+    (callers fall back to mocks).
+    """
+    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    vertex = _vertex_configured()
+    if not api_key and not vertex:
+        startup_report.warn(
+            "No Gemini credentials (GEMINI_API_KEY / GOOGLE_API_KEY, or GOOGLE_GENAI_USE_VERTEXAI "
+            "with GOOGLE_CLOUD_PROJECT): embeddings and answers are local mocks"
+        )
+        return None
+    try:
+        with startup_report.phase("import:google.genai"):
+            from google import genai
+    except Exception as e:  # pragma: no cover
+        startup_report.warn(f"google-genai unavailable, embeddings and answers are local mocks: {e}")
+        return None
+    # Without arguments the client reads the Vertex project and location from the environment
+    return genai.Client() if vertex else genai.Client(api_key=api_key)
+
+
+def _supabase_client():
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("Supabase credentials missing: SUPABASE_URL or SUPABASE_KEY")
+    with startup_report.phase("import:supabase"):
+        from supabase import create_client
+    return create_client(url, key)
+
+
+gemini = Provider("gemini", _gemini_client)
+supabase = Provider("supabase", _supabase_client)
+
+
+def get_gemini_client():
+    return gemini.get()
+
+
+def get_supabase_client():
+    return supabase.get()
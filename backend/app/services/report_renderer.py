@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, Iterator, Optional
+
+from .metrics import count_cache, observe_stage
+
+# Render worker processes; rendering holds the GIL for hundreds of milliseconds
+EXPORT_RENDER_PROCESSES = int(os.getenv("EXPORT_RENDER_PROCESSES", "2"))
+# Rendered reports kept in memory, keyed by hash of (doc_id, analysis)
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", "256"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Bytes per chunk when streaming a report to the client
+EXPORT_STREAM_CHUNK = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_CSS = """
+body {
+  font-family: 'Inter', system-ui, Arial, sans-serif;
+  margin: 40px;
+  line-height: 1.6;
+  color: #333;
+}
+h1 {
+  color: #4f46e5;
+  border-bottom: 2px solid #e5e7eb;
+  padding-bottom: 10px;
+}
+pre {
+  background: #f9fafb;
+  padding: 20px;
+  border-radius: 8px;
+  border: 1px solid #e5e7eb;
+  white-space: pre-wrap;
+  font-size: 12px;
+  overflow-x: auto;
+}
+"""
+
+_HTML = """<!DOCTYPE html>
+<html>
+  <head><meta charset="utf-8"></head>
+  <body>
+    <h1>LegalLens Report</h1>
+    <p><strong>Document ID:</strong> {doc_id}</p>
+    <p><strong>Generated:</strong> {generated}</p>
+    <h2>Analysis Results</h2>
+    <pre>{analysis}</pre>
+  </body>
+</html>
+"""
+
+# Per-worker renderer state, filled once by _init_worker
+_worker: Dict = {}
+
+
+def _init_worker() -> None:
+    """
+    Load the renderer once per process: WeasyPrint with its parsed stylesheet
+    and font configuration (warmed by one throwaway render, which is when
+    fontconfig scans the system fonts), or ReportLab's sample stylesheet.
+    """
+    # Skip WeasyPrint on Windows due to GTK dependency issues
+    if platform.system() != "Windows":
+        try:
+            from weasyprint import CSS, HTML  # type: ignore
+            from weasyprint.text.fonts import FontConfiguration  # type: ignore
+
+            fonts = FontConfiguration()
+            css = CSS(string=_CSS, font_config=fonts)
+            HTML(string="<p>warm</p>").write_pdf(stylesheets=[css], font_config=fonts)
+            _worker.update(engine="weasyprint", html=HTML, css=css, fonts=fonts)
+            return
+        except Exception as e:
+            logger.warning("WeasyPrint unavailable (%s), using ReportLab", e)
+    from reportlab.lib.styles import getSampleStyleSheet  # type: ignore
+
+    _worker.update(engine="reportlab", styles=getSampleStyleSheet())
+
+
+def _ping() -> str:
+    return _worker.get("engine", "")
+
+
+def _render(doc_id: str, analysis: Dict) -> bytes:
+    """Runs in a worker process."""
+    if _worker.get("engine") == "weasyprint":
+        try:
+            return _render_weasyprint(doc_id, analysis)
+        except Exception as e:
+            logger.warning("WeasyPrint failed: %s, falling back to ReportLab", e)
+            if "styles" not in _worker:
+                from reportlab.lib.styles import getSampleStyleSheet  # type: ignore
+
+                _worker["styles"] = getSampleStyleSheet()
+    return _render_reportlab(doc_id, analysis)
+
+
+def _render_weasyprint(doc_id: str, analysis: Dict) -> bytes:
+    document = _HTML.format(
+        doc_id=html.escape(doc_id),
+        generated=html.escape(json.dumps(analysis.get("timestamp", "Unknown"), indent=2)),
+        analysis=html.escape(json.dumps(analysis, indent=2)),
+    )
+    return _worker["html"](string=document).write_pdf(stylesheets=[_worker["css"]], font_config=_worker["fonts"])
+
+
+def _render_reportlab(doc_id: str, analysis: Dict) -> bytes:
+    from reportlab.lib.pagesizes import A4  # type: ignore
+    from reportlab.lib.units import inch  # type: ignore
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer  # type: ignore
+
+    styles = _worker["styles"]
+    out = BytesIO()
+    doc = SimpleDocTemplate(out, pagesize=A4, topMargin=1 * inch, bottomMargin=1 * inch)
+    story = [
+        Paragraph("LegalLens Report", styles["Title"]),
+        Spacer(1, 20),
+        Paragraph(f"<b>Document ID:</b> {html.escape(doc_id)}", styles["Normal"]),
+        Spacer(1, 20),
+    ]
+    if "answer" in analysis:
+        story += [Paragraph(f"<b>Answer:</b><br/>{html.escape(str(analysis['answer']))}", styles["Normal"]),
+                  Spacer(1, 15)]
+    risk = analysis.get("risk")
+    if isinstance(risk, dict):
+        story += [Paragraph(
+            f"<b>Risk Assessment:</b><br/>Level: {html.escape(str(risk.get('level', 'Unknown')))}"
+            f"<br/>Score: {html.escape(str(risk.get('score', 'Unknown')))}", styles["Normal"]),
+            Spacer(1, 15)]
+    if "confidence" in analysis:
+        story += [Paragraph(f"<b>Confidence:</b> {html.escape(str(analysis['confidence']))}", styles["Normal"]),
+                  Spacer(1, 15)]
+    doc.build(story)
+    return out.getvalue()
+
+
+def report_key(doc_id: str, analysis: Dict) -> str:
+    payload = json.dumps({"doc_id": doc_id, "analysis": analysis}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_bytes(data: bytes, chunk_size: int = EXPORT_STREAM_CHUNK) -> Iterator[bytes]:
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+class ReportRenderer:
+    """
+    Renders export PDFs in a pool of pre-warmed worker processes, so a burst
+    of downloads never blocks the event loop. Finished reports are cached
+    (LRU, bounded by count and bytes) by report_key, and concurrent requests
+    for the same report share a single render.
+    """
+
+    def __init__(self, processes: int = EXPORT_RENDER_PROCESSES, max_entries: int = EXPORT_CACHE_SIZE,
+                 max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.processes = processes
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: the parent has live threads (event loop, HTTP pools)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    async def warm(self) -> None:
+        """Start every worker and let it load its renderer before the first export."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            engines = await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(self.processes)))
+        except Exception as e:
+            logger.warning("Export render pool warm-up failed: %s", e)
+            return
+        logger.info("Export render pool ready: %d workers (%s)", self.processes, ", ".join(sorted(set(engines))))
+
+    async def render(self, doc_id: str, analysis: Dict) -> bytes:
+        key = report_key(doc_id, analysis)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            count_cache("export", "hit")
+            return cached
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            count_cache("export", "hit")
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        count_cache("export", "miss")
+        # The render belongs to no request: a caller that disconnects stops
+        # waiting for it, but the render (and everyone else waiting) carries on
+        task = asyncio.create_task(self._render_and_store(key, doc_id, analysis))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._render_done(key, t))
+        return await asyncio.shield(task)
+
+    async def _render_and_store(self, key: str, doc_id: str, analysis: Dict) -> bytes:
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            data = await loop.run_in_executor(self._get_pool(), _render, doc_id, analysis)
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise
+        observe_stage("export", time.perf_counter() - t0)
+        self._store(key, data)
+        return data
+
+    def _render_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every waiter had gone
+
+    def stats(self) -> Dict:
+        return {
+            "processes": self.processes,
+            "cached_reports": len(self._cache),
+            "cached_bytes": self._cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def shutdown(self) -> None:
+        self._reset_pool()
+
+    def _store(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self._cache[key] = data
+        self._cache_bytes += len(data)
+        while len(self._cache) > self.max_entries or self._cache_bytes > self.max_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= len(old)
+
+    def _reset_pool(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+_renderer: Optional[ReportRenderer] = None
+
+
+def get_report_renderer() -> ReportRenderer:
+    global _renderer
+    if _renderer is None:
+        _renderer = ReportRenderer()
+    return _renderer
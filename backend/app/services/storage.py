@@ -1,44 +1,181 @@
+import asyncio
+import logging
 import os
-from typing import Optional
-from supabase import create_client
+import random
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
 from dotenv import load_dotenv
 
+load_dotenv()
+
+from .providers import get_supabase_client  # noqa: E402
 
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "legal-lens-uploads")
-load_dotenv()
+# "supabase" or "local"; unset picks Supabase when SUPABASE_URL is configured, else local files
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "")
+STORAGE_LOCAL_DIR = os.getenv(
+    "STORAGE_LOCAL_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "uploads")
+)
+# PDFs uploaded at once across every ingest job in the process
+STORAGE_UPLOAD_CONCURRENCY = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", "4"))
+# Attempts per upload / delete, with exponential backoff (plus jitter) between them
+STORAGE_ATTEMPTS = int(os.getenv("STORAGE_ATTEMPTS", "3"))
+STORAGE_BACKOFF_S = float(os.getenv("STORAGE_BACKOFF_S", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+
+def object_path(user_id: str, doc_id: str) -> str:
+    return f"{user_id}/{doc_id}.pdf"
+
+
+class SupabaseStorage:
+    """Supabase Storage through the process-wide client, so uploads share its connection pool."""
+
+    name = "supabase"
+
+    def __init__(self, bucket: str = SUPABASE_BUCKET):
+        self.bucket = bucket
+
+    def upload(self, key: str, path: str) -> None:
+        # The open file is streamed as the multipart body, not read into memory
+        with open(path, "rb") as fh:
+            res = get_supabase_client().storage.from_(self.bucket).upload(
+                path=key,
+                file=fh,
+                file_options={"content-type": "application/pdf", "upsert": "true"},
+            )
+        if getattr(res, "error", None):
+            raise RuntimeError(f"Supabase upload failed: {res.error}")
+
+    def delete(self, key: str) -> None:
+        get_supabase_client().storage.from_(self.bucket).remove([key])
+
+
+class LocalStorage:
+    """PDFs kept under STORAGE_LOCAL_DIR, for offline deployments and local dev."""
+
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_DIR):
+        self.root = root
+
+    def upload(self, key: str, path: str) -> None:
+        dest = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Copy next to the destination, then rename, so readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out, open(path, "rb") as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+def _default_backend():
+    backend = STORAGE_BACKEND or ("supabase" if os.getenv("SUPABASE_URL") else "local")
+    if backend == "supabase":
+        return SupabaseStorage()
+    if backend == "local":
+        return LocalStorage()
+    raise ValueError(f"unknown STORAGE_BACKEND {backend!r}")
+
+
+class StorageService:
+    """
+    Async front for the storage backend: blocking calls run in threads, at
+    most STORAGE_UPLOAD_CONCURRENCY uploads are in flight, and failures are
+    retried with backoff.
+    """
+
+    def __init__(self, backend=None, concurrency: int = STORAGE_UPLOAD_CONCURRENCY):
+        self.backend = backend or _default_backend()
+        self.concurrency = concurrency
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Backend call running for each object key; a cancelled caller can't stop its thread
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._stats = {"uploads": 0, "bytes": 0, "deletes": 0, "retries": 0, "failures": 0}
+
+    async def upload(self, user_id: str, doc_id: str, path: str) -> str:
+        key = object_path(user_id, doc_id)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            await self._attempt(f"upload {key}", key, self.backend.upload, path)
+        self._stats["uploads"] += 1
+        self._stats["bytes"] += os.path.getsize(path)
+        return key
 
-def _client():
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
-    if not url or not key:
-        raise RuntimeError("Supabase credentials missing: SUPABASE_URL or SUPABASE_KEY")
-    return create_client(url, key)
+    async def upload_many(self, user_id: str, files: Sequence[Tuple[str, str, str]]) -> List[str]:
+        """Uploads (doc_id, filename, path) triples concurrently; raises on the first failure."""
 
+        async def one(doc_id: str, filename: str, path: str) -> str:
+            try:
+                return await self.upload(user_id, doc_id, path)
+            except Exception as e:
+                raise RuntimeError(f"storage upload failed for {filename}: {e}") from e
 
-def upload_pdf(user_id: str, doc_id: str, filename: str, data: bytes) -> str:
-    path = f"{user_id}/{doc_id}.pdf"
-    client = _client()
-    
-    try:
+        tasks = [asyncio.create_task(one(*f)) for f in files]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            raise
 
-        res = client.storage.from_(SUPABASE_BUCKET).update(
-        path=path,
-        file=data,
-            file_options={"contentType": "application/pdf"},
-        )
-    except Exception as e:
-        raise RuntimeError(f"Supabase upload failed: {e}")
+    async def delete(self, user_id: str, doc_id: str) -> None:
+        key = object_path(user_id, doc_id)
+        # An upload whose caller was cancelled may still be running; let it land first
+        running = self._calls.get(key)
+        if running is not None:
+            await asyncio.gather(running, return_exceptions=True)
+        await self._attempt(f"delete {key}", key, self.backend.delete)
+        self._stats["deletes"] += 1
 
-    if hasattr(res, "error") and res.error:
-        raise RuntimeError(f"Supabase upload failed: {res.error}")
+    async def _attempt(self, what: str, key: str, fn, *args) -> None:
+        for attempt in range(1, STORAGE_ATTEMPTS + 1):
+            call = asyncio.ensure_future(asyncio.to_thread(fn, key, *args))
+            self._calls[key] = call
+            call.add_done_callback(lambda c: self._forget(key, c))
+            try:
+                await asyncio.shield(call)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == STORAGE_ATTEMPTS:
+                    self._stats["failures"] += 1
+                    raise
+                self._stats["retries"] += 1
+                delay = STORAGE_BACKOFF_S * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning("Storage %s failed (attempt %d/%d), retrying in %.1fs: %s",
+                               what, attempt, STORAGE_ATTEMPTS, delay, e)
+                await asyncio.sleep(delay)
 
-    return path
+    def _forget(self, key: str, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()  # retrieved here when its caller was cancelled
 
+    def stats(self) -> Dict:
+        return {"backend": self.backend.name, "concurrency": self.concurrency, **self._stats}
 
 
-def delete_pdf(user_id: str, doc_id: str) -> None:
-    path = f"{user_id}/{doc_id}.pdf"
-    client = _client()
-    client.storage.from_(SUPABASE_BUCKET).remove([path])
+_storage: Optional[StorageService] = None
 
 
+def get_storage() -> StorageService:
+    global _storage
+    if _storage is None:
+        _storage = StorageService()
+    return _storage
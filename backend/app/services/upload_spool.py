@@ -0,0 +1,80 @@
+import logging
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+from fastapi.responses import JSONResponse
+
+from .hashing import new_content_hasher
+
+# Largest accepted PDF; anything bigger is rejected with 413 instead of being buffered
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(150 * 1024 * 1024)))
+# Largest /upload request body (every file in it), checked against Content-Length before it is read
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(4 * UPLOAD_MAX_BYTES)))
+# Uploads are copied here until their ingest job finishes; on disk, not in RAM
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", tempfile.gettempdir())
+UPLOAD_COPY_CHUNK = int(os.getenv("UPLOAD_COPY_CHUNK", str(1024 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class SpooledUpload:
+    """An uploaded PDF copied to a temp file, with its size and content hash."""
+
+    def __init__(self, path: str, size: int, digest: str):
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_upload(src: BinaryIO, size_hint: Optional[int] = None, max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """
+    Copies an upload to UPLOAD_SPOOL_DIR in UPLOAD_COPY_CHUNK pieces, hashing
+    as it goes, so the whole PDF is never held in memory. Raises
+    UploadTooLarge as soon as the copy passes max_bytes. Blocking; run it
+    in a thread.
+    """
+    if size_hint is not None and size_hint > max_bytes:
+        raise UploadTooLarge(f"file is {size_hint} bytes; the limit is {max_bytes}")
+    hasher = new_content_hasher()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            src.seek(0)
+            while True:
+                chunk = src.read(UPLOAD_COPY_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"file is over the {max_bytes} byte limit")
+                hasher.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path, size, hasher.hexdigest())
+
+
+async def upload_size_middleware(request, call_next):
+    """Rejects an oversized /upload from its Content-Length, before the body is parsed."""
+    if request.method == "POST" and request.url.path == "/upload":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > UPLOAD_MAX_REQUEST_BYTES:
+            logger.info("Rejected a %s byte upload (limit %d)", length, UPLOAD_MAX_REQUEST_BYTES)
+            return JSONResponse(
+                {"error": f"request body is over the {UPLOAD_MAX_REQUEST_BYTES} byte limit"},
+                status_code=413,
+            )
+    return await call_next(request)
@@ -1,39 +1,111 @@
+import logging
 import os
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
 import numpy as np
 from dotenv import load_dotenv
 load_dotenv()
 
-try:
-    from pinecone import Pinecone
-except Exception:  # pragma: no cover
-    Pinecone = None  # type: ignore
-    print("Pinecone not available, will use in-memory fallback")
+from .ann_index import ANN_MIN_ROWS, ann_search, make_ann  # noqa: E402 (reads env set by .env)
+from .metrics import set_vector_backend  # noqa: E402
+from .providers import startup_report  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys that get posting lists in the in-memory index, so a filter on
+# them selects row indices directly instead of testing every vector.
+POSTING_KEYS = ("doc_id", "category", "user_id", "source")
+
+# Worker threads (and therefore pooled HTTP connections) per Pinecone index handle.
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+# Upper bound on Pinecone queries in flight for one query_many call.
+QUERY_CONCURRENCY = int(os.getenv("VECTOR_QUERY_CONCURRENCY", "8"))
+# "mmap" keeps vectors in a persistent memory-mapped store under VECTOR_STORE_DIR
+# instead of Pinecone / the in-process fallback.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "")
+# Pinecone accepts at most 1000 ids per delete request.
+DELETE_BATCH_SIZE = 1000
+# Ids per Pinecone fetch; they go in the query string, so keep requests short
+FETCH_BATCH_SIZE = 200
+
+
+def _import_pinecone():
+    """The Pinecone SDK is only imported when a key is configured."""
+    try:
+        with startup_report.phase("import:pinecone"):
+            from pinecone import Pinecone
+        return Pinecone
+    except Exception:  # pragma: no cover
+        logger.info("Pinecone not available, will use in-memory fallback")
+        return None
+
 
 class VectorDB:
     def __init__(self):
-        print("Initializing VectorDB...")
         self.api_key = os.getenv("PINECONE_API_KEY")
         self.env = os.getenv("PINECONE_ENV")
         self.index_name = os.getenv("PINECONE_INDEX", "legal-lens-index")
         self._client = None
         self._index = None
-        self._memory: List[Dict] = []  # fallback in-memory store
-        print(f"Pinecone API key: {'found' if self.api_key else 'not found'}")
+        self._query_pool: Optional[ThreadPoolExecutor] = None
+        self._stats = {"upserted": 0, "queries": 0, "deletes": 0, "index_stats": None}
+        if VECTOR_BACKEND == "mmap":
+            from .mmap_index import MmapIndex
+
+            self._local = MmapIndex()
+            logger.info("Using memory-mapped vector store")
+            set_vector_backend(self.backend)
+            return
+        self._local = _MemoryIndex()  # fallback in-memory store
+        logger.debug("Pinecone API key: %s", "found" if self.api_key else "not found")
+        Pinecone = _import_pinecone() if self.api_key else None
         if self.api_key and Pinecone:
             try:
-                self._client = Pinecone(api_key=self.api_key)
-                self._index = self._client.Index(self.index_name)
-                print(f"Connected to Pinecone index: {self.index_name}")
+                self._client = Pinecone(api_key=self.api_key, pool_threads=PINECONE_POOL_THREADS)
+                self._index = self._client.Index(self.index_name, pool_threads=PINECONE_POOL_THREADS)
+                logger.info("Connected to Pinecone index: %s", self.index_name)
             except Exception as e:
                 self._client = None
                 self._index = None
-                print(f"Pinecone init failed: {e}")
+                logger.warning("Pinecone init failed: %s", e)
         else:
-            print("Using in-memory vector store")
+            logger.info("Using in-memory vector store")
+        set_vector_backend(self.backend)
+
+    @property
+    def backend(self) -> str:
+        if self._index:
+            return "pinecone"
+        return "mmap" if VECTOR_BACKEND == "mmap" else "memory"
+
+    def warm(self) -> None:
+        """Open the pooled connection to the index ahead of the first request."""
+        if not self._index:
+            return
+        try:
+            self._stats["index_stats"] = _to_dict(self._index.describe_index_stats())
+        except Exception as e:
+            logger.warning("Pinecone warm-up failed: %s", e)
+
+    def stats(self) -> Dict:
+        out = {
+            "backend": self.backend,
+            "index_name": self.index_name if self._index else None,
+            "upserted": self._stats["upserted"],
+            "queries": self._stats["queries"],
+            "deletes": self._stats["deletes"],
+        }
+        if self._index:
+            out["index_stats"] = self._stats["index_stats"]
+        else:
+            out["vectors"] = len(self._local)
+            if hasattr(self._local, "stats"):
+                out["store"] = self._local.stats()
+        return out
 
     def upsert(self, vectors: List[Dict]):
-        print(f"Upserting {len(vectors)} vectors...")
+        self._stats["upserted"] += len(vectors)
         try:
             if self._index:
                 items = [
@@ -45,27 +117,22 @@ class VectorDB:
                     for v in vectors
                 ]
                 self._index.upsert(items)
-                print("Upserted to Pinecone successfully")
-                return
-            self._memory.extend(vectors)
-            print("Upserted to in-memory store")
+            else:
+                self._local.upsert(vectors)
+            logger.debug("Upserted %d vectors to %s", len(vectors), self.backend)
         except Exception as e:
-            print(f"VectorDB upsert failed: {e}")
+            logger.error("VectorDB upsert failed: %s", e)
             raise RuntimeError(f"VectorDB upsert failed: {e}")
 
     def query(self,
               vector: List[float],
               top_k: int = 5,
               filter: Optional[Dict] = None) -> List[Dict]:
-        print("Querying VectorDB...")
-        # print(self._index)
-        # print(self._index.describe_index_stats())
-        #print(vector)
+        self._stats["queries"] += 1
         if self._index:
             res = self._index.query(vector=vector, top_k=top_k, filter=filter, include_metadata=True)
-            print("helolo")
             matches = res.get("matches", [])
-            print(f"Found {len(matches)} matches in Pinecone")
+            logger.debug("Found %d matches in Pinecone", len(matches))
             return [
                 {
                     "id": m.get("id"),
@@ -74,28 +141,300 @@ class VectorDB:
                 }
                 for m in matches
             ]
-        # simple cosine in-memory
-        candidates = [m for m in self._memory if _match_filter(m.get("metadata", {}), filter)]
-        q = np.array(vector)
-        out: List[Dict] = []
-        for c in candidates:
-            v = np.array(c["values"])  # type: ignore
-            cs = float(q @ v / (np.linalg.norm(q) * np.linalg.norm(v) + 1e-9))
-            out.append({"id": c["id"], "score": cs, "metadata": c.get("metadata", {})})
-        out.sort(key=lambda x: x["score"], reverse=True)
-        print(f"Found {len(out)} matches in-memory")
-        return out[:top_k]
-
-    def delete_by_doc(self, doc_id: str):
-        print(f"Deleting vectors for doc_id={doc_id}...")
+        out = self._local.query(vector, top_k=top_k, filter=filter)
+        logger.debug("Found %d matches in %s store", len(out), self.backend)
+        return out
+
+    def query_many(self,
+                   vector: List[float],
+                   filters: List[Optional[Dict]],
+                   top_k: int = 5) -> List[Dict]:
+        """
+        Query once per filter and merge into a single top_k by score.
+        Pinecone queries run concurrently; the in-memory index scores the
+        union of the filtered rows in one pass.
+        """
+        if not filters:
+            return []
+        if not self._index:
+            self._stats["queries"] += 1
+            return self._local.query_many(vector, filters, top_k=top_k)
+        if len(filters) == 1:
+            return self.query(vector, top_k=top_k, filter=filters[0])
+        if self._query_pool is None:
+            self._query_pool = ThreadPoolExecutor(
+                max_workers=QUERY_CONCURRENCY, thread_name_prefix="vdb-query"
+            )
+        results = self._query_pool.map(lambda f: self.query(vector, top_k=top_k, filter=f), filters)
+        return _merge_top_k(results, top_k)
+
+    def delete_ids(self, ids: List[str]) -> int:
+        """Delete vectors by id; no metadata filter, so it works on serverless indexes too."""
+        if not ids:
+            return 0
+        self._stats["deletes"] += 1
+        if self._index:
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                self._index.delete(ids=ids[start:start + DELETE_BATCH_SIZE])
+            return len(ids)
+        return self._local.delete_ids(ids)
+
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict]:
+        """Stored metadata (chunk text included) of the vectors with these ids that exist."""
+        if not self._index:
+            return self._local.metadata(ids)
+        out = {}
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            res = _to_dict(self._index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE]))
+            for vid, v in (res.get("vectors") or {}).items():
+                out[vid] = dict(_to_dict(v).get("metadata") or {})
+        return out
+
+    def has_doc(self, doc_id: str) -> bool:
+        """Whether the store holds the document's vectors; chunk 0 exists for every ingested document."""
+        return bool(self.fetch_metadata([f"{doc_id}_chunk_0"]))
+
+    def delete_by_doc(self, doc_id: str) -> Optional[int]:
+        """
+        Vectors removed: 0 when the document has none, None when Pinecone
+        deleted some by filter without reporting how many.
+        """
+        self._stats["deletes"] += 1
         if self._index:
+            # A filter delete reports nothing, so check first that there is something to delete
+            if not self.has_doc(doc_id):
+                return 0
             self._index.delete(filter={"doc_id": doc_id})
-            print("Deleted from Pinecone index")
+            logger.info("Deleted vectors of doc_id=%s from Pinecone", doc_id)
+            return None
+        removed = self._local.delete_by_doc(doc_id)
+        logger.info("Deleted %d vectors of doc_id=%s from %s store", removed, doc_id, self.backend)
+        return removed
+
+
+_shared: Optional[VectorDB] = None
+_shared_lock = threading.Lock()
+
+
+def get_vector_db() -> VectorDB:
+    """
+    Process-wide VectorDB shared by every request (FastAPI dependency).
+    Created and warmed on app startup; built lazily if used before that.
+    """
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = VectorDB()
+    return _shared
+
+
+class _MemoryIndex:
+    """
+    In-memory cosine index: one contiguous float32 matrix of L2-normalised rows,
+    with per-key postings (metadata value -> row indices) for filtering.
+    Rows are updated in place; deletes move the last row into the freed slot.
+    With VECTOR_ANN set, large searches go through an IVF index (ann_index).
+    The instance is shared across requests, so public methods hold a lock.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._initial_capacity = initial_capacity
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._meta: List[Dict] = []
+        self._row_of: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {k: {} for k in POSTING_KEYS}
+        self._lock = threading.RLock()
+        self._ann = make_ann()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        if not vectors:
+            return
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.ndim != 2:
+            raise ValueError("vectors must all have the same dimension")
+        values /= np.linalg.norm(values, axis=1, keepdims=True) + 1e-9
+        with self._lock:
+            self._reserve(self._size + len(vectors), values.shape[1])
+            written = np.empty(len(vectors), dtype=np.int64)
+            for i, (v, row_values) in enumerate(zip(vectors, values)):
+                vid = str(v["id"])
+                meta = dict(v.get("metadata", {}))
+                row = self._row_of.get(vid)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._ids.append(vid)
+                    self._meta.append(meta)
+                    self._row_of[vid] = row
+                else:
+                    self._unindex(row)
+                    self._meta[row] = meta
+                self._matrix[row] = row_values
+                self._index(row)
+                written[i] = row
+            if self._ann is not None:
+                self._ann.set_rows(written, values)
+                if not self._ann.trained and self._size >= ANN_MIN_ROWS:
+                    self._ann.build_async(self._lock, lambda: self._matrix[:self._size])
+
+    def query(self, vector: List[float], top_k: int = 5, filter: Optional[Dict] = None) -> List[Dict]:
+        return self.query_many(vector, [filter], top_k=top_k)
+
+    def query_many(self, vector: List[float], filters: List[Optional[Dict]], top_k: int = 5) -> List[Dict]:
+        """Top-k over rows matching any of the filters (their union)."""
+        if self._size == 0 or top_k <= 0 or not filters:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        if q.shape[0] != self._matrix.shape[1]:
+            raise ValueError(f"query dimension {q.shape[0]} != index dimension {self._matrix.shape[1]}")
+        q = q / (np.linalg.norm(q) + 1e-9)
+
+        with self._lock:
+            selected = [self._select(f) for f in filters]
+            if any(rows is None for rows in selected):
+                rows = None
+            elif len(selected) == 1:
+                rows = selected[0]
+            else:
+                rows = np.unique(np.concatenate(selected))
+
+            hit = ann_search(self._ann, q, self._matrix[:self._size], rows, top_k)
+            if hit is not None:
+                rows, scores = hit
+                best = range(rows.size)
+            elif rows is None:
+                scores = self._matrix[:self._size] @ q
+                rows = np.arange(self._size)
+            elif rows.size == 0:
+                return []
+            else:
+                scores = self._matrix[rows] @ q
+
+            if hit is None:
+                k = min(top_k, scores.shape[0])
+                best = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(k)
+                best = best[np.argsort(-scores[best], kind="stable")]
+            return [
+                {"id": self._ids[rows[i]], "score": float(scores[i]), "metadata": dict(self._meta[rows[i]])}
+                for i in best
+            ]
+
+    def delete_by_doc(self, doc_id: str) -> int:
+        with self._lock:
+            rows = sorted(self._postings["doc_id"].get(doc_id, ()), reverse=True)
+            for row in rows:
+                self._remove_row(row)
+            return len(rows)
+
+    def metadata(self, ids: List[str]) -> Dict[str, Dict]:
+        with self._lock:
+            return {i: dict(self._meta[self._row_of[i]]) for i in ids if i in self._row_of}
+
+    def delete_ids(self, ids: List[str]) -> int:
+        with self._lock:
+            rows = sorted((self._row_of[i] for i in ids if i in self._row_of), reverse=True)
+            for row in rows:
+                self._remove_row(row)
+            return len(rows)
+
+    def _select(self, flt: Optional[Dict]) -> Optional[np.ndarray]:
+        """Row indices matching the filter, or None when every row matches."""
+        if not flt:
+            return None
+        indexed = [(k, v) for k, v in flt.items() if k in self._postings and _hashable(v)]
+        rest = {k: v for k, v in flt.items() if (k, v) not in indexed}
+        if indexed:
+            postings = sorted((self._postings[k].get(v, set()) for k, v in indexed), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = range(self._size)
+        if rest:
+            candidates = [r for r in candidates if _match_filter(self._meta[r], rest)]
+        return np.fromiter(sorted(candidates), dtype=np.int64)
+
+    def _reserve(self, needed: int, dim: int) -> None:
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, needed)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            return
+        if dim != self._matrix.shape[1]:
+            raise ValueError(f"vector dimension {dim} != index dimension {self._matrix.shape[1]}")
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
             return
-        before = len(self._memory)
-        self._memory = [m for m in self._memory if m.get("metadata", {}).get("doc_id") != doc_id]
-        after = len(self._memory)
-        print(f"Deleted {before - after} vectors from in-memory store")
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def _index(self, row: int) -> None:
+        meta = self._meta[row]
+        for key, postings in self._postings.items():
+            value = meta.get(key)
+            if value is not None and _hashable(value):
+                postings.setdefault(value, set()).add(row)
+
+    def _unindex(self, row: int) -> None:
+        meta = self._meta[row]
+        for key, postings in self._postings.items():
+            value = meta.get(key)
+            if value is None or not _hashable(value):
+                continue
+            rows = postings.get(value)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del postings[value]
+
+    def _remove_row(self, row: int) -> None:
+        last = self._size - 1
+        self._unindex(row)
+        del self._row_of[self._ids[row]]
+        if row != last:
+            self._unindex(last)
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._meta[row] = self._meta[last]
+            self._row_of[self._ids[row]] = row
+            self._index(row)
+            if self._ann is not None:
+                self._ann.move(last, row)
+        if self._ann is not None:
+            self._ann.truncate(last)
+        self._ids.pop()
+        self._meta.pop()
+        self._size = last
+
+
+def _merge_top_k(results, top_k: int) -> List[Dict]:
+    best: Dict[str, Dict] = {}
+    for matches in results:
+        for m in matches:
+            prev = best.get(m["id"])
+            if prev is None or (m.get("score") or 0) > (prev.get("score") or 0):
+                best[m["id"]] = m
+    return sorted(best.values(), key=lambda m: m.get("score") or 0, reverse=True)[:top_k]
+
+
+def _to_dict(obj: Any) -> Any:
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return obj
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
 
 
 def _match_filter(meta: Dict, flt: Optional[Dict]) -> bool:
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# Offline, isolated state; set before any app module reads its config
+_STATE_DIR = tempfile.mkdtemp(prefix="legal-lens-test-")
+for _key in ("GEMINI_API_KEY", "GOOGLE_API_KEY", "PINECONE_API_KEY", "SUPABASE_URL", "DATABASE_URL"):
+    os.environ.pop(_key, None)
+os.environ.update({
+    "VECTOR_BACKEND": "",
+    "CHUNK_STORE_PATH": "",
+    "STARTUP_WARM": "off",
+    "STORAGE_BACKEND": "local",
+    "STORAGE_LOCAL_DIR": os.path.join(_STATE_DIR, "uploads"),
+    "DOC_REGISTRY_PATH": os.path.join(_STATE_DIR, "doc_registry.sqlite"),
+})
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
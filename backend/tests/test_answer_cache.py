@@ -0,0 +1,57 @@
+"""
+Answer-cache entries carry the registry version of their documents, so a
+delete or re-upload made by another worker process is seen on lookup.
+"""
+import os
+import tempfile
+
+from app.services.answer_cache import AnswerCache
+from app.services.doc_registry import DocRegistry
+
+_QVEC = [1.0, 0.0, 0.0]
+_CONTEXT = ["category:loan", "d1_chunk_0"]
+
+
+def _registry_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "doc_registry.sqlite")
+
+
+def _registry() -> DocRegistry:
+    return DocRegistry(url="", path=_registry_path())
+
+
+def test_entry_dropped_after_reupload_elsewhere():
+    path = _registry_path()
+    registry = DocRegistry(url="", path=path)
+    registry.record("d1", "u", "loan", "a.pdf", "h1", 1, 1)
+    worker_a, worker_b = AnswerCache(), AnswerCache()
+    worker_a.store(_QVEC, _CONTEXT, registry.versions(["d1"]), "answer")
+    assert worker_a.lookup(_QVEC, _CONTEXT, registry.versions(["d1"])) == "answer"
+
+    # Worker B re-ingests the document; worker A never hears of it
+    other = DocRegistry(url="", path=path)
+    other.record("d1", "u", "loan", "a.pdf", "h2", 1, 1)
+    worker_b.invalidate_doc("d1")
+
+    assert worker_a.lookup(_QVEC, _CONTEXT, registry.versions(["d1"])) is None
+    assert worker_a.stats()["entries"] == 0
+
+
+def test_entry_dropped_after_delete():
+    registry = _registry()
+    registry.record("d1", "u", "loan", "a.pdf", "h1", 1, 1)
+    cache = AnswerCache()
+    cache.store(_QVEC, _CONTEXT, registry.versions(["d1"]), "answer")
+    registry.delete("d1")
+    assert registry.versions(["d1"]) == {"d1": None}
+    assert cache.lookup(_QVEC, _CONTEXT, registry.versions(["d1"])) is None
+
+
+def test_entry_for_other_documents_not_reused():
+    registry = _registry()
+    registry.record("d1", "u", "loan", "a.pdf", "h1", 1, 1)
+    cache = AnswerCache()
+    cache.store(_QVEC, _CONTEXT, registry.versions(["d1", "d2"]), "answer")
+    # Same retrieved chunks, but asked without d2: its version is unknown here
+    assert cache.lookup(_QVEC, _CONTEXT, registry.versions(["d1"])) is None
+    assert cache.lookup(_QVEC, _CONTEXT, registry.versions(["d1", "d2"])) == "answer"
@@ -0,0 +1,60 @@
+"""
+A re-upload of an already-ingested PDF is only short-circuited while the
+vector store still holds the document; the in-memory store loses it on
+restart while the registry row survives.
+"""
+import time
+
+import fitz
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.vector_db import _MemoryIndex, get_vector_db
+
+
+def _pdf() -> bytes:
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "1. Prepayment. The borrower may prepay the loan with 30 days notice.")
+    page.insert_text((72, 96), "2. Default interest. Late instalments carry interest at 2% per month.")
+    return doc.tobytes()
+
+
+def _upload(client: TestClient, pdf: bytes) -> dict:
+    r = client.post(
+        "/upload",
+        files={"files": ("contract.pdf", pdf, "application/pdf")},
+        data={"category": "loan", "user_id": "test-user"},
+    )
+    assert r.status_code in (200, 202), r.text
+    body = r.json()
+    deadline = time.monotonic() + 30
+    while True:
+        job = client.get(f"/jobs/{body['job_id']}").json()
+        if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done", job
+    return {"status_code": r.status_code, **job}
+
+
+def test_reupload_reingests_when_vectors_are_gone():
+    pdf = _pdf()
+    with TestClient(app) as client:
+        first = _upload(client, pdf)
+        doc_id = first["doc_ids"][0]
+        vdb = get_vector_db()
+        assert vdb.has_doc(doc_id)
+
+        # Unchanged store: the second upload reuses the ingested document
+        again = _upload(client, pdf)
+        assert again["status_code"] == 200
+
+        # Restarted in-memory store: the registry row is still there, the vectors are not
+        vdb._local = _MemoryIndex()
+        assert not vdb.has_doc(doc_id)
+
+        third = _upload(client, pdf)
+        assert third["status_code"] == 202
+        assert third["doc_ids"] == [doc_id]
+        assert vdb.has_doc(doc_id)
@@ -0,0 +1,179 @@
+"""
+Offline end-to-end load test: synthetic multi-hundred-page contracts go
+through POST /upload (until their ingest jobs finish), then concurrent
+POST /ask requests run against them. Gemini, Pinecone and Supabase are
+replaced by local fakes with injected latency (see fakes.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+# Isolated, throwaway state; set before the app modules read their config
+_STATE_DIR = tempfile.mkdtemp(prefix="legal-lens-bench-")
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("CHUNK_STORE_PATH", "")
+os.environ.setdefault("DOC_REGISTRY_PATH", os.path.join(_STATE_DIR, "doc_registry.sqlite"))
+os.environ.setdefault("VECTOR_STORE_DIR", os.path.join(_STATE_DIR, "vectors"))
+
+import fakes  # noqa: E402  (also puts backend/ on sys.path)
+from synthetic import contract_pdf  # noqa: E402
+
+_TOPICS = ("prepayment fee", "late payment interest", "events of default", "termination notice",
+           "security deposit", "assignment", "governing law", "indemnity", "monthly instalment")
+
+
+def summarize(latencies: List[float], wall: float) -> Dict:
+    if not latencies:
+        return {"requests": 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+async def upload_phase(client, args) -> Dict:
+    pdfs = await asyncio.to_thread(lambda: [contract_pdf(args.pages, seed=i) for i in range(args.docs)])
+    slots = asyncio.Semaphore(args.upload_concurrency)
+    accepted, completed, stages, doc_ids, failures = [], [], {}, [], 0
+
+    async def one(i: int, pdf: bytes):
+        nonlocal failures
+        async with slots:
+            t0 = time.perf_counter()
+            r = await client.post(
+                "/upload",
+                files={"files": (f"contract-{i}.pdf", pdf, "application/pdf")},
+                data={"category": "loan", "user_id": f"bench-user-{i % args.users}"},
+            )
+            if r.status_code not in (200, 202):
+                failures += 1
+                return
+            accepted.append(time.perf_counter() - t0)
+            job_id = r.json()["job_id"]
+            while True:
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.05)
+            if job["status"] != "done":
+                failures += 1
+                return
+            completed.append(time.perf_counter() - t0)
+            doc_ids.append((f"bench-user-{i % args.users}", job["doc_ids"][0]))
+            for name, info in job["stages"].items():
+                stages.setdefault(name, []).append(info["seconds"] or 0.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, pdf) for i, pdf in enumerate(pdfs)))
+    wall = time.perf_counter() - t0
+    return {
+        "docs": args.docs,
+        "pages_per_doc": args.pages,
+        "failures": failures,
+        "wall_s": round(wall, 2),
+        "pages_per_s": round(len(completed) * args.pages / wall, 1) if wall else None,
+        "accept": summarize(accepted, wall),
+        "ingest": summarize(completed, wall),
+        "stage_mean_s": {k: round(float(np.mean(v)), 3) for k, v in stages.items()},
+        "_doc_ids": doc_ids,
+    }
+
+
+async def ask_phase(client, args, doc_ids) -> Dict:
+    slots = asyncio.Semaphore(args.ask_concurrency)
+    latencies, failures, cached = [], 0, 0
+    rng = random.Random(0)
+
+    async def one(i: int):
+        nonlocal failures, cached
+        user_id, doc_id = rng.choice(doc_ids)
+        # Unique questions unless --repeat-questions, so the answer cache only hits when asked to
+        n = rng.randrange(args.repeat_questions) if args.repeat_questions else i
+        question = f"What does the contract say about {_TOPICS[n % len(_TOPICS)]}? ({n})"
+        async with slots:
+            t0 = time.perf_counter()
+            r = await client.post("/ask", json={
+                "user_id": user_id, "doc_ids": [doc_id], "question": question, "category": "loan",
+            })
+            if r.status_code != 200:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - t0)
+            cached += bool(r.json().get("cached"))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.asks)))
+    wall = time.perf_counter() - t0
+    return {"failures": failures, "cached": cached, "wall_s": round(wall, 2), **summarize(latencies, wall)}
+
+
+async def run(args) -> Dict:
+    import httpx
+
+    fakes.install(embed_ms=args.embed_ms, llm_ms=args.llm_ms, vector_ms=args.vector_ms,
+                  storage_ms=args.storage_ms, jitter=args.jitter, fake_vector_db=args.vector == "fake")
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            upload = await upload_phase(client, args)
+            doc_ids = upload.pop("_doc_ids")
+            ask = await ask_phase(client, args, doc_ids) if doc_ids else {"requests": 0}
+            health = (await client.get("/health")).json()
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "upload": upload,
+        "ask": ask,
+        "vector_store": health["vector_store"]["backend"],
+    }
+
+
+def main(args):
+    report = asyncio.run(run(args))
+    up, ask = report["upload"], report["ask"]
+    print(f"upload: {args.docs} docs x {args.pages} pages in {up['wall_s']}s "
+          f"({up['pages_per_s']} pages/s, {up['failures']} failed)")
+    if up["ingest"].get("requests"):
+        print(f"  ingest latency p50 {up['ingest']['p50_ms']} ms, p95 {up['ingest']['p95_ms']} ms, "
+              f"p99 {up['ingest']['p99_ms']} ms; stage means {up['stage_mean_s']}")
+    if ask.get("requests"):
+        print(f"ask: {ask['requests']} requests, {ask['throughput_per_s']}/s, p50 {ask['p50_ms']} ms, "
+              f"p95 {ask['p95_ms']} ms, p99 {ask['p99_ms']} ms ({ask['cached']} cached, {ask['failures']} failed)")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline /upload and /ask load test against local fakes")
+    parser.add_argument("--docs", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--asks", type=int, default=200)
+    parser.add_argument("--ask-concurrency", type=int, default=16)
+    parser.add_argument("--repeat-questions", type=int, default=0,
+                        help="draw questions from this many distinct ones (exercises the answer cache)")
+    parser.add_argument("--embed-ms", type=float, default=80, help="fake Gemini embed_content latency")
+    parser.add_argument("--llm-ms", type=float, default=1200, help="fake Gemini generation latency")
+    parser.add_argument("--vector-ms", type=float, default=20, help="fake Pinecone latency per call")
+    parser.add_argument("--storage-ms", type=float, default=60, help="fake Supabase upload latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter, as a fraction")
+    parser.add_argument("--vector", choices=("fake", "local"), default="fake",
+                        help="fake Pinecone, or the app's own local backend (VECTOR_BACKEND / VECTOR_ANN)")
+    parser.add_argument("--json", help="write the report here")
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+"""
+Micro-benchmarks for the hot paths: chunk_pages on synthetic contracts,
+extract_text_by_page on synthetic PDFs (in-process and on the extract pool),
+and VectorDB.query on the local backend at 10k / 100k / 1M chunks.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+os.environ.setdefault("VECTOR_STORE_DIR", tempfile.mkdtemp(prefix="legal-lens-bench-vectors-"))
+
+import fakes  # noqa: E402,F401  (puts backend/ on sys.path)
+from synthetic import contract_pages, contract_pdf  # noqa: E402
+
+
+def timings(fn: Callable[[], object], repeat: int) -> Dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t0) * 1000)
+    ms = np.asarray(runs)
+    return {
+        "runs": repeat,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def bench_chunking(page_counts: List[int], repeat: int) -> List[Dict]:
+    from app.services.chunker import chunk_pages
+
+    out = []
+    for n in page_counts:
+        pages = contract_pages(n)
+        chunks = chunk_pages(pages)
+        row = {"pages": n, "chunks": len(chunks), **timings(lambda: chunk_pages(pages), repeat)}
+        row["pages_per_s"] = round(n / (row["p50_ms"] / 1000), 1)
+        out.append(row)
+        print(f"chunk_pages     {n:>6} pages  {len(chunks):>6} chunks  p50 {row['p50_ms']:>9} ms  "
+              f"p95 {row['p95_ms']:>9} ms  {row['pages_per_s']} pages/s")
+    return out
+
+
+def bench_extraction(page_counts: List[int], repeat: int) -> List[Dict]:
+    from app.services.pdf_extractor import extract_text_by_page, get_extract_pool, iter_text_by_page
+
+    out = []
+    pool = get_extract_pool()
+    list(iter_text_by_page(contract_pdf(1), pool=pool))  # start the workers outside the timings
+    for n in page_counts:
+        pdf = contract_pdf(n)
+        for mode, fn in (("serial", lambda: extract_text_by_page(pdf)),
+                         ("pool", lambda: list(iter_text_by_page(pdf, pool=pool)))):
+            row = {"pages": n, "mode": mode, **timings(fn, repeat)}
+            row["pages_per_s"] = round(n / (row["p50_ms"] / 1000), 1)
+            out.append(row)
+            print(f"extract ({mode:<6}) {n:>6} pages  p50 {row['p50_ms']:>9} ms  "
+                  f"p95 {row['p95_ms']:>9} ms  {row['pages_per_s']} pages/s")
+    return out
+
+
+def bench_vector_query(sizes: List[int], dim: int, queries: int, chunks_per_doc: int) -> List[Dict]:
+    from app.services.vector_db import VectorDB
+
+    out = []
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    for size in sizes:
+        vdb = VectorDB()
+        vdb._index = None  # always the local backend, whatever keys the environment has
+        t0 = time.perf_counter()
+        for start in range(0, size, 10000):
+            n = min(10000, size - start)
+            values = centers[rng.integers(0, len(centers), n)] + rng.standard_normal((n, dim)).astype(np.float32)
+            vdb.upsert([
+                {
+                    "id": f"doc{(start + i) // chunks_per_doc}_chunk_{(start + i) % chunks_per_doc}",
+                    "values": values[i],
+                    "metadata": {
+                        "doc_id": f"doc{(start + i) // chunks_per_doc}",
+                        "category": ("loan", "rental", "tos")[(start + i) // chunks_per_doc % 3],
+                        "source": "category" if (start + i) // chunks_per_doc % 2 else "user",
+                    },
+                }
+                for i in range(n)
+            ])
+        load_s = time.perf_counter() - t0
+        qs = [(centers[rng.integers(0, len(centers))] + rng.standard_normal(dim)).astype(np.float32).tolist()
+              for _ in range(queries)]
+        n_docs = max(1, size // chunks_per_doc)
+        docs = [f"doc{rng.integers(0, n_docs)}" for _ in range(queries)]
+        it = iter(range(10 ** 9))
+
+        def doc_filter():
+            # One counter value per call, so each query keeps its own doc
+            i = next(it)
+            return vdb.query_many(qs[i % len(qs)], [{"doc_id": docs[i % len(docs)]}], top_k=5)
+
+        cases = {
+            "unfiltered": lambda: vdb.query(qs[next(it) % len(qs)], top_k=5),
+            "doc_filter": doc_filter,
+            "category_filter": lambda: vdb.query(qs[next(it) % len(qs)], top_k=3,
+                                                 filter={"category": "loan", "source": "category"}),
+        }
+        for name, fn in cases.items():
+            fn()  # first query builds lazily-created state outside the timings
+            row = {"chunks": size, "dim": dim, "backend": vdb.backend, "query": name,
+                   "load_s": round(load_s, 2), **timings(fn, queries)}
+            out.append(row)
+            print(f"VectorDB.query {size:>8} chunks  {name:<16} p50 {row['p50_ms']:>8} ms  "
+                  f"p95 {row['p95_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  ({vdb.backend}, load {row['load_s']}s)")
+        del vdb
+    return out
+
+
+def main(args):
+    report = {}
+    if "chunk" in args.only:
+        report["chunk_pages"] = bench_chunking(args.chunk_pages, args.repeat)
+    if "extract" in args.only:
+        report["extract_text_by_page"] = bench_extraction(args.extract_pages, args.repeat)
+    if "query" in args.only:
+        report["vector_query"] = bench_vector_query(args.sizes, args.dim, args.queries, args.chunks_per_doc)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks: chunking, extraction, vector queries")
+    parser.add_argument("--only", nargs="+", choices=("chunk", "extract", "query"),
+                        default=["chunk", "extract", "query"])
+    parser.add_argument("--chunk-pages", type=int, nargs="+", default=[50, 300, 1000])
+    parser.add_argument("--extract-pages", type=int, nargs="+", default=[50, 300])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="chunks in the index (1M at 768 dims needs about 4 GB of RAM)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chunks-per-doc", type=int, default=200)
+    parser.add_argument("--json", help="write the results here")
+    main(parser.parse_args())
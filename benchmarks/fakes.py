@@ -0,0 +1,173 @@
+"""
+Local stand-ins for Gemini, Pinecone and Supabase, with injected latency, so
+the benchmarks exercise the real request pipeline without network access.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+
+class Latency:
+    """A delay of about `ms` milliseconds, +/- `jitter` (a fraction of ms)."""
+
+    def __init__(self, ms: float = 0.0, jitter: float = 0.2):
+        self.ms = ms
+        self.jitter = jitter
+
+    def seconds(self) -> float:
+        if self.ms <= 0:
+            return 0.0
+        return max(0.0, self.ms * random.uniform(1 - self.jitter, 1 + self.jitter)) / 1000
+
+    def sleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class _Embedding:
+    def __init__(self, values: List[float]):
+        self.values = values
+
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeModels:
+    def __init__(self, embed: Latency, llm: Latency, answer_words: int):
+        self.embed = embed
+        self.llm = llm
+        self.answer_words = answer_words
+
+    def embed_content(self, model: str, contents: List[str], config=None):
+        from app.services.embeddings import _mock_embed
+
+        self.embed.sleep()
+        return _Result(embeddings=[_Embedding(_mock_embed(t)) for t in contents])
+
+    def generate_content(self, model: str, contents: str, config=None):
+        self.llm.sleep()
+        return _Result(text=_answer(self.answer_words))
+
+
+class FakeAioModels:
+    def __init__(self, llm: Latency, answer_words: int):
+        self.llm = llm
+        self.answer_words = answer_words
+
+    async def generate_content_stream(self, model: str, contents: str, config=None):
+        words = _answer(self.answer_words).split(" ")
+        total = self.llm.seconds()
+
+        async def stream():
+            # First token after a third of the time, the rest spread evenly
+            await asyncio.sleep(total / 3)
+            for word in words:
+                await asyncio.sleep(2 * total / 3 / len(words))
+                yield _Result(text=word + " ")
+
+        return stream()
+
+
+class FakeGenaiClient:
+    """Just the google-genai surface the app calls: models.* and aio.models.*"""
+
+    def __init__(self, embed: Latency, llm: Latency, answer_words: int = 120):
+        self.models = FakeModels(embed, llm, answer_words)
+        self.aio = _Result(models=FakeAioModels(llm, answer_words))
+
+
+class FakePineconeIndex:
+    """Pinecone Index API over the in-memory cosine index, plus network latency per call."""
+
+    def __init__(self, latency: Latency):
+        from app.services.vector_db import _MemoryIndex
+
+        self.latency = latency
+        self._store = _MemoryIndex()
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        self.latency.sleep()
+        self._store.upsert(vectors)
+
+    def query(self, vector: List[float], top_k: int = 5, filter: Optional[Dict] = None,
+              include_metadata: bool = True) -> Dict:
+        self.latency.sleep()
+        return {"matches": self._store.query(vector, top_k=top_k, filter=filter)}
+
+    def fetch(self, ids: List[str]) -> Dict:
+        self.latency.sleep()
+        return {"vectors": {vid: {"id": vid, "metadata": meta} for vid, meta in self._store.metadata(ids).items()}}
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None) -> None:
+        self.latency.sleep()
+        if ids:
+            self._store.delete_ids(ids)
+        elif filter and "doc_id" in filter:
+            self._store.delete_by_doc(filter["doc_id"])
+
+    def describe_index_stats(self) -> Dict:
+        return {"total_vector_count": len(self._store)}
+
+
+class FakeStorage:
+    """Storage backend that records object sizes instead of uploading."""
+
+    name = "fake"
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.objects: Dict[str, int] = {}
+
+    def upload(self, key: str, path: str) -> None:
+        self.latency.sleep()
+        self.objects[key] = os.path.getsize(path)
+
+    def delete(self, key: str) -> None:
+        self.latency.sleep()
+        self.objects.pop(key, None)
+
+
+def install(embed_ms: float = 0, llm_ms: float = 0, vector_ms: float = 0, storage_ms: float = 0,
+            jitter: float = 0.2, fake_vector_db: bool = True) -> Dict:
+    """
+    Point the app's Gemini client, storage backend and (optionally) its
+    shared VectorDB at the fakes. Call before the app starts serving.
+    """
+    from app.services import providers
+    from app.services.storage import get_storage
+    from app.services.vector_db import get_vector_db
+
+    genai_client = FakeGenaiClient(Latency(embed_ms, jitter), Latency(llm_ms, jitter))
+    providers.gemini.set(genai_client)
+    storage = FakeStorage(Latency(storage_ms, jitter))
+    get_storage().backend = storage
+    fakes = {"genai": genai_client, "storage": storage}
+    if fake_vector_db:
+        index = FakePineconeIndex(Latency(vector_ms, jitter))
+        get_vector_db()._index = index
+        fakes["pinecone"] = index
+    return fakes
+
+
+_WORDS = (
+    "the borrower shall repay the principal together with accrued interest as set out in "
+    "clause four and any prepayment is subject to a fee of two percent of the amount prepaid"
+).split()
+
+
+def _answer(n_words: int) -> str:
+    return " ".join(random.choice(_WORDS) for _ in range(n_words))
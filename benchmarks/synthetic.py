@@ -0,0 +1,66 @@
+"""
+Synthetic contracts: numbered sections, sub-clauses and (a)/(b) items of
+legal-sounding text, as page text or as a PDF, sized by page count.
+"""
+import random
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+_SECTIONS = (
+    "Definitions", "Loan Amount", "Interest", "Repayment", "Prepayment", "Fees and Charges",
+    "Security", "Covenants", "Events of Default", "Remedies", "Indemnity", "Assignment",
+    "Notices", "Governing Law", "Dispute Resolution", "Termination", "Confidentiality",
+)
+_SUBJECTS = ("The Borrower", "The Lender", "Each party", "The Guarantor", "The Tenant", "The Landlord")
+_VERBS = ("shall pay", "shall notify", "may terminate", "shall indemnify", "shall not assign", "may demand")
+_OBJECTS = (
+    "all outstanding amounts", "the principal sum", "any accrued interest", "the security deposit",
+    "reasonable legal costs", "the prepayment fee", "written notice of default", "the monthly instalment",
+)
+_TAILS = (
+    "within thirty (30) days of the due date", "in accordance with Section {ref}",
+    "without prejudice to any other right or remedy", "at the rate specified in Schedule 1",
+    "subject to the limitations set out in this Agreement", "on or before the last business day of each month",
+)
+
+
+def _sentence(rng: random.Random, n_sections: int) -> str:
+    tail = rng.choice(_TAILS).format(ref=rng.randint(1, n_sections))
+    return f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)} {tail}."
+
+
+def contract_pages(n_pages: int, seed: int = 0, lines_per_page: int = 45) -> List[Tuple[int, str]]:
+    """(page_number, text) pairs, the shape extract_text_by_page returns."""
+    rng = random.Random(seed)
+    n_sections = max(1, n_pages // 3)
+    pages = []
+    section, clause = 0, 0
+    for page in range(1, n_pages + 1):
+        lines = []
+        while len(lines) < lines_per_page:
+            roll = rng.random()
+            if roll < 0.08 or section == 0:
+                section, clause = section + 1, 0
+                lines.append(f"Section {section}. {_SECTIONS[(section - 1) % len(_SECTIONS)]}")
+            elif roll < 0.35:
+                clause += 1
+                lines.append(f"{section}.{clause} " + " ".join(_sentence(rng, n_sections) for _ in range(rng.randint(1, 3))))
+            elif roll < 0.55:
+                lines.append(f"({'abcdefgh'[rng.randint(0, 7)]}) {_sentence(rng, n_sections)}")
+            else:
+                lines.append(_sentence(rng, n_sections))
+        pages.append((page, "\n".join(lines)))
+    return pages
+
+
+def contract_pdf(n_pages: int, seed: int = 0) -> bytes:
+    """A text PDF of n_pages contract pages."""
+    doc = fitz.open()
+    try:
+        for _, text in contract_pages(n_pages, seed):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=7)
+        return doc.tobytes()
+    finally:
+        doc.close()
@@ -1,6 +1,30 @@
 import React, { useState } from 'react'
 import axios from 'axios'
 
+const baseURL = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000'
+
+// Stop polling after this long; ingestion may still finish on the server
+const JOB_POLL_DEADLINE_MS = 5 * 60 * 1000
+const JOB_POLL_INTERVAL_MS = 1000
+
+// /upload queues an ingest job; poll its status until it finishes.
+// 'timeout': still running at the deadline. 'unknown': /jobs no longer has it
+// (served by another instance, or pruned from the job history).
+async function waitForJob(jobId: string) {
+  const deadline = Date.now() + JOB_POLL_DEADLINE_MS
+  while (Date.now() < deadline) {
+    try {
+      const { data } = await axios.get(`/jobs/${jobId}`, { baseURL })
+      if (data.status === 'done' || data.status === 'failed') return data
+    } catch (e: any) {
+      if (e?.response?.status === 404) return { status: 'unknown' }
+      throw e
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+  }
+  return { status: 'timeout' }
+}
+
 type Props = {
   onUploaded?: (docId: string) => void
 }
@@ -23,15 +47,25 @@ export default function UploadPanel({ onUploaded }: Props) {
     try {
       const { data } = await axios.post('/upload', form, {
         headers: { 'Content-Type': 'multipart/form-data' },
-        baseURL: process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000',
+        baseURL,
       })
 
-      // Supabase se aa raha response
-      if (data?.doc_id) {
-        setStatus(`✅ Uploaded & processed (${data.chunks_count} chunks)`)
-        onUploaded?.(data.doc_id)
+      if (!data?.job_id) {
+        setStatus('⚠️ Upload succeeded but no job_id returned')
+        return
+      }
+      setStatus('Processing...')
+      const job = await waitForJob(data.job_id)
+      if (job.status === 'done') {
+        const docs = job.result.documents.length
+        setStatus(`✅ Uploaded & processed ${docs} file${docs > 1 ? 's' : ''} (${job.result.chunks_count} chunks)`)
+        job.doc_ids.forEach((id: string) => onUploaded?.(id))
+      } else if (job.status === 'timeout') {
+        setStatus('⏳ Still processing; refresh later to see the document')
+      } else if (job.status === 'unknown') {
+        setStatus('⚠️ Lost track of the processing job; refresh later to check whether the document was added')
       } else {
-        setStatus('⚠️ Upload succeeded but no doc_id returned')
+        setStatus(`❌ Processing failed: ${job.error}`)
       }
     } catch (e: any) {
       console.error(e)
@@ -0,0 +1,105 @@
+"""
+Recall and latency of the local IVF / IVF-PQ index against exact search.
+Runs on synthetic clustered embeddings, or on real ones from a .npy file
+(rows of the matrix; queries are perturbed rows of it).
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.services.ann_index import IVFIndex  # noqa: E402
+
+
+def synthetic(n: int, dim: int, clusters: int, spread: float, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def exact(matrix: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ q
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def timed(fn, queries):
+    out, times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        out.append(fn(q))
+        times.append((time.perf_counter() - t0) * 1000)
+    return out, times
+
+
+def latency(times) -> dict:
+    return {"mean_ms": round(float(np.mean(times)), 3), "p95_ms": round(float(np.percentile(times, 95)), 3)}
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    if args.vectors:
+        matrix = np.load(args.vectors).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+    else:
+        matrix = synthetic(args.rows, args.dim, args.clusters, args.spread, rng)
+    picks = matrix[rng.integers(0, len(matrix), args.queries)]
+    queries = picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    truth, times = timed(lambda q: exact(matrix, q, args.k), queries)
+    report = {"rows": len(matrix), "dim": matrix.shape[1], "k": args.k, "exact": latency(times), "indexes": []}
+    print(f"{len(matrix)} rows x {matrix.shape[1]} dims, {args.queries} queries, k={args.k}")
+    print(f"exact: {report['exact']['mean_ms']} ms mean, {report['exact']['p95_ms']} ms p95")
+
+    variants = [("ivf", 0)] + [("ivfpq", m) for m in args.pq_m if m]
+    for name, pq_m in variants:
+        ann = IVFIndex(pq_m=pq_m, nlist=args.nlist, rerank=args.rerank)
+        t0 = time.perf_counter()
+        ann.train(matrix[rng.choice(len(matrix), min(len(matrix), args.train_sample), replace=False)], len(matrix))
+        trained = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for start in range(0, len(matrix), 16384):
+            ann.set_rows(np.arange(start, min(start + 16384, len(matrix))), matrix[start:start + 16384])
+        assigned = time.perf_counter() - t0
+        entry = {"index": name, "pq_m": pq_m, "nlist": len(ann.centroids),
+                 "train_s": round(trained, 2), "assign_s": round(assigned, 2), "nprobe": []}
+        print(f"\n{name} pq_m={pq_m} nlist={entry['nlist']} train {trained:.2f}s assign {assigned:.2f}s")
+        for nprobe in args.nprobe:
+            found, times = timed(lambda q: ann.search(q, matrix, args.k, nprobe=nprobe), queries)
+            recall = np.mean([
+                len(set(t.tolist()) & set(f[0].tolist())) / args.k if f is not None else 0.0
+                for t, f in zip(truth, found)
+            ])
+            row = {"nprobe": nprobe, "recall": round(float(recall), 4), **latency(times)}
+            entry["nprobe"].append(row)
+            print(f"  nprobe={nprobe:<4} recall@{args.k}={row['recall']:.3f}  "
+                  f"{row['mean_ms']} ms mean  {row['p95_ms']} ms p95")
+        report["indexes"].append(entry)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF / IVF-PQ recall vs latency against exact search")
+    parser.add_argument("--vectors", help=".npy matrix of embeddings (default: synthetic)")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200, help="synthetic topic clusters")
+    parser.add_argument("--spread", type=float, default=1.0, help="synthetic within-cluster noise")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="coarse lists (0: about sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--pq-m", type=int, nargs="*", default=[64], help="PQ sub-quantizers to try")
+    parser.add_argument("--rerank", type=int, default=16)
+    parser.add_argument("--train-sample", type=int, default=65536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results here")
+    main(parser.parse_args())
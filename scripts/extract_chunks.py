@@ -1,13 +1,40 @@
+import argparse
 import json
-import sys
 from pathlib import Path
 
-def main(pdf_path: str, out_path: str):
-    # Placeholder chunk extraction; real logic in backend services
-    chunks = [{"chunk_id": 0, "text": "Sample chunk", "page_start": 1, "page_end": 1}]
-    Path(out_path).write_text(json.dumps({"chunks": chunks}, indent=2), encoding="utf-8")
+from seed_pipeline import SEED_WORKERS, extract_document, find_sources, iter_extracted
 
-if __name__ == "__main__":
-    main(sys.argv[1], sys.argv[2])
 
+def main(source: str, out_path: str, workers: int = SEED_WORKERS):
+    """
+    One PDF/text file -> {"chunks": [...]} JSON. A directory -> JSON Lines, one
+    extracted document per line; reruns append only files not yet in out_path.
+    """
+    if Path(source).is_file():
+        doc = extract_document(source)
+        Path(out_path).write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"{doc['filename']}: {doc['pages']} pages, {len(doc['chunks'])} chunks")
+        return
+
+    done = set()
+    if Path(out_path).exists():
+        with open(out_path, encoding="utf-8") as fh:
+            done = {json.loads(line)["path"] for line in fh if line.strip()}
+    paths = [str(p) for p in find_sources(source) if str(p) not in done]
+    print(f"Extracting {len(paths)} files ({len(done)} already in {out_path}) with {workers} workers")
+    n_docs = n_chunks = 0
+    with open(out_path, "a", encoding="utf-8") as out:
+        for doc in iter_extracted(paths, workers):
+            out.write(json.dumps(doc) + "\n")
+            n_docs += 1
+            n_chunks += len(doc["chunks"])
+    print(f"Wrote {n_docs} documents, {n_chunks} chunks")
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF/text files -> chunks")
+    parser.add_argument("source", help="a PDF/.txt file or a directory of them")
+    parser.add_argument("out", help="output .json (single file) or .jsonl (directory)")
+    parser.add_argument("--workers", type=int, default=SEED_WORKERS)
+    args = parser.parse_args()
+    main(args.source, args.out, args.workers)
@@ -1,18 +1,29 @@
 import argparse
-import json
-from pathlib import Path
 
-def main(category: str, directory: str):
-    files = list(Path(directory).glob('*.txt'))
-    print(f"Seeding category {category} with {len(files)} files (placeholder)")
-    meta = [{"doc_id": f.stem, "category": category, "filename": f.name, "source": "seed"} for f in files]
-    Path('seed_metadata.json').write_text(json.dumps(meta, indent=2), encoding='utf-8')
+from seed_pipeline import (
+    SEED_WORKERS, Checkpoint, ThroughputStats, find_sources, iter_extracted, seed_documents,
+)
+from app.services.vector_db import VectorDB
+
+
+def main(category: str, directory: str, workers: int, checkpoint: str, stats_path: str):
+    done = Checkpoint(checkpoint)
+    paths = [str(p) for p in find_sources(directory) if str(p) not in done]
+    print(f"Seeding category {category}: {len(paths)} files to go, {len(done.done)} already done")
+    vdb = VectorDB()
+    if vdb.backend == "memory":
+        print("warning: no vector index configured; vectors will only live in this process")
+    stats = ThroughputStats(stats_path)
+    seed_documents(iter_extracted(paths, workers), category, vdb, done, stats)
+
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(description="Seed a category corpus (PDF/.txt files) into the vector index")
     parser.add_argument('--category', required=True)
     parser.add_argument('--dir', required=True)
+    parser.add_argument('--workers', type=int, default=SEED_WORKERS)
+    parser.add_argument('--checkpoint', help="resume file of finished documents (default: <dir>/.seed-<category>.checkpoint)")
+    parser.add_argument('--stats', default='seed_stats.json', help="throughput stats JSON")
     args = parser.parse_args()
-    main(args.category, args.dir)
-
-
+    main(args.category, args.dir, args.workers,
+         args.checkpoint or f"{args.dir.rstrip('/')}/.seed-{args.category}.checkpoint", args.stats)
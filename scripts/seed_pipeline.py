@@ -0,0 +1,217 @@
+"""
+Shared offline bulk pipeline for the seeding scripts: extraction and chunking
+in a process pool, batched concurrent embedding, and concurrent large-batch
+upserts, resumable through a checkpoint file of finished documents.
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.services.chunker import chunk_pages  # noqa: E402
+from app.services.embeddings import embed_chunks  # noqa: E402
+from app.services.hashing import content_hash, doc_id_for  # noqa: E402
+from app.services.pdf_extractor import extract_text_by_page  # noqa: E402
+from app.services.vector_db import VectorDB  # noqa: E402
+
+SOURCE_SUFFIXES = (".pdf", ".txt")
+# Extraction processes, and documents extracted ahead of the embedder
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", str(os.cpu_count() or 1)))
+# Chunks gathered before one embed/upsert round; embed_chunks batches and
+# parallelises the Gemini calls within it
+SEED_GROUP_CHUNKS = int(os.getenv("SEED_GROUP_CHUNKS", "1024"))
+# Vectors per upsert request (Pinecone caps requests at 2 MB) and requests in flight
+SEED_UPSERT_BATCH = int(os.getenv("SEED_UPSERT_BATCH", "200"))
+SEED_UPSERT_CONCURRENCY = int(os.getenv("SEED_UPSERT_CONCURRENCY", "4"))
+
+
+def find_sources(directory: str) -> List[Path]:
+    return sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in SOURCE_SUFFIXES)
+
+
+def extract_document(path: str) -> Dict:
+    """Read, hash, extract and chunk one file. Runs in a worker process."""
+    data = Path(path).read_bytes()
+    if path.lower().endswith(".pdf"):
+        pages = extract_text_by_page(data)
+    else:
+        pages = [(1, data.decode("utf-8", errors="replace"))]
+    return {
+        "filename": Path(path).name,
+        "path": str(path),
+        "content_hash": content_hash(data),
+        "pages": len(pages),
+        "chunks": chunk_pages(pages),
+    }
+
+
+def iter_extracted(paths: Iterable[str], workers: int = SEED_WORKERS) -> Iterator[Dict]:
+    """Extract documents in a process pool, at most 2 * workers ahead, in input order."""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        todo = iter(paths)
+        for path in todo:
+            pending.append((path, pool.submit(extract_document, str(path))))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            path, fut = pending.popleft()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(extract_document, str(nxt))))
+            try:
+                yield fut.result()
+            except Exception as e:
+                print(f"skipping {path}: {e}", file=sys.stderr)
+
+
+class Checkpoint:
+    """
+    Append-only file of finished documents (their source path); reruns skip
+    them before extraction.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                self.done = {line.strip() for line in fh if line.strip()}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, keys: Iterable[str]) -> None:
+        keys = [k for k in keys if k not in self.done]
+        self.done.update(keys)
+        if self.path and keys:
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write("".join(f"{k}\n" for k in keys))
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+class ThroughputStats:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.started = time.perf_counter()
+        self.docs = self.skipped = self.pages = self.chunks = self.cached = 0
+        self.embed_seconds = self.upsert_seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        wall = time.perf_counter() - self.started
+        return {
+            "docs": self.docs,
+            "skipped": self.skipped,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "cached_chunks": self.cached,
+            "wall_seconds": round(wall, 2),
+            "embed_seconds": round(self.embed_seconds, 2),
+            "upsert_seconds": round(self.upsert_seconds, 2),
+            "docs_per_second": round(self.docs / wall, 2) if wall else 0.0,
+            "pages_per_second": round(self.pages / wall, 2) if wall else 0.0,
+            "chunks_per_second": round(self.chunks / wall, 2) if wall else 0.0,
+        }
+
+    def report(self) -> None:
+        stats = self.to_dict()
+        print(
+            f"{stats['docs']} docs ({stats['skipped']} skipped), {stats['chunks']} chunks, "
+            f"{stats['chunks_per_second']} chunks/s, {stats['docs_per_second']} docs/s",
+            flush=True,
+        )
+        if self.path:
+            Path(self.path).write_text(json.dumps(stats, indent=2), encoding="utf-8")
+
+
+def seed_documents(docs: Iterable[Dict], category: str, vdb: VectorDB, checkpoint: Checkpoint,
+                   stats: ThroughputStats, source: str = "category",
+                   group_chunks: int = SEED_GROUP_CHUNKS) -> None:
+    """
+    Embed and upsert extracted documents (dicts from extract_document) in
+    rounds of about group_chunks chunks. A round's upserts run while the next
+    round embeds; its documents are checkpointed once all their vectors are in.
+    """
+    owner = f"{source}:{category}"
+    group: List[Dict] = []
+    size = 0
+    in_flight = None
+    with ThreadPoolExecutor(max_workers=SEED_UPSERT_CONCURRENCY, thread_name_prefix="seed-upsert") as upserts:
+        for doc in docs:
+            doc.setdefault("doc_id", doc_id_for(owner, doc["content_hash"]))
+            if _key(doc) in checkpoint:
+                stats.skipped += 1
+                continue
+            group.append(doc)
+            size += len(doc["chunks"])
+            if size >= group_chunks:
+                round_ = _embed_round(group, category, source, vdb, upserts, stats)
+                _finish_round(in_flight, checkpoint, stats)
+                in_flight, group, size = round_, [], 0
+        if group:
+            round_ = _embed_round(group, category, source, vdb, upserts, stats)
+            _finish_round(in_flight, checkpoint, stats)
+            in_flight = round_
+        _finish_round(in_flight, checkpoint, stats)
+    if not stats.docs:
+        stats.report()
+
+
+def _embed_round(group: List[Dict], category: str, source: str, vdb: VectorDB,
+                 upserts: ThreadPoolExecutor, stats: ThroughputStats):
+    """Embed a round's chunks and start its upserts; returns what _finish_round waits on."""
+    items = [(doc, c) for doc in group for c in doc["chunks"] if c["text"].strip()]
+    t0 = time.perf_counter()
+    vectors, cached = embed_chunks([c["text"] for _, c in items])
+    stats.embed_seconds += time.perf_counter() - t0
+    stats.cached += cached
+
+    records = [_record(doc, c, vec, category, source) for (doc, c), vec in zip(items, vectors)]
+    batches = [records[i:i + SEED_UPSERT_BATCH] for i in range(0, len(records), SEED_UPSERT_BATCH)]
+    return group, len(records), time.perf_counter(), [upserts.submit(vdb.upsert, b) for b in batches]
+
+
+def _finish_round(round_, checkpoint: Checkpoint, stats: ThroughputStats) -> None:
+    if round_ is None:
+        return
+    group, n_records, started, futures = round_
+    for fut in futures:
+        fut.result()
+    stats.upsert_seconds += time.perf_counter() - started
+    checkpoint.mark(_key(doc) for doc in group)
+    stats.docs += len(group)
+    stats.pages += sum(doc["pages"] for doc in group)
+    stats.chunks += n_records
+    stats.report()
+
+
+def _key(doc: Dict) -> str:
+    return doc.get("path") or doc["doc_id"]
+
+
+def _record(doc: Dict, c: Dict, vec: List[float], category: str, source: str) -> Dict:
+    vid = f"{doc['doc_id']}_chunk_{c['chunk_id']}"
+    meta = {
+        "id": vid,
+        "doc_id": doc["doc_id"],
+        "content_hash": doc["content_hash"],
+        "category": category,
+        "filename": doc["filename"],
+        "page_start": c["page_start"],
+        "page_end": c["page_end"],
+        "chunk_id": c["chunk_id"],
+        "text": c["text"],
+        "source": source,
+    }
+    if c.get("section"):
+        meta["section"] = c["section"]
+    return {"id": vid, "values": vec, "metadata": meta}
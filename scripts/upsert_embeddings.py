@@ -1,11 +1,45 @@
+import argparse
+import hashlib
 import json
-import sys
+from typing import Dict, Iterator
 
-def main(chunks_json: str):
-    data = json.loads(open(chunks_json, 'r', encoding='utf-8').read())
-    print(f"Upserting {len(data.get('chunks', []))} chunks (mock)")
+from seed_pipeline import Checkpoint, ThroughputStats, seed_documents
+from app.services.vector_db import VectorDB
 
-if __name__ == "__main__":
-    main(sys.argv[1])
+
+def read_documents(chunks_json: str) -> Iterator[Dict]:
+    """Documents from extract_chunks.py output: a .json document or a .jsonl of them."""
+    with open(chunks_json, encoding="utf-8") as fh:
+        if not chunks_json.endswith(".jsonl"):
+            yield _complete(json.load(fh), chunks_json)
+            return
+        for line in fh:
+            if line.strip():
+                yield _complete(json.loads(line), chunks_json)
+
+
+def _complete(doc: Dict, source: str) -> Dict:
+    if "content_hash" not in doc:
+        text = "\n".join(c["text"] for c in doc["chunks"])
+        doc["content_hash"] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    doc.setdefault("filename", source)
+    doc.setdefault("pages", max((c["page_end"] for c in doc["chunks"]), default=0))
+    return doc
 
 
+def main(chunks_json: str, category: str, checkpoint: str, stats_path: str):
+    vdb = VectorDB()
+    if vdb.backend == "memory":
+        print("warning: no vector index configured; vectors will only live in this process")
+    stats = ThroughputStats(stats_path)
+    seed_documents(read_documents(chunks_json), category, vdb, Checkpoint(checkpoint), stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chunks -> Gemini embeddings -> vector index")
+    parser.add_argument("chunks_json", help="output of extract_chunks.py")
+    parser.add_argument("--category", required=True)
+    parser.add_argument("--checkpoint", help="resume file of finished documents")
+    parser.add_argument("--stats", help="write throughput stats JSON here")
+    args = parser.parse_args()
+    main(args.chunks_json, args.category, args.checkpoint or f"{args.chunks_json}.checkpoint", args.stats)